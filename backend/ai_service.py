@@ -5,8 +5,10 @@ import os
 import json
 import re
 import base64
+from datetime import date, datetime
+
+# 模块级导入：gunicorn --preload 时在 master 中导入一次，worker fork 后共享
 import httpx
-from datetime import date
 
 ZHIPU_API_URL = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
 
@@ -160,7 +162,6 @@ def _parse_and_clean(raw_content: str) -> dict:
 
     # 清洗 date：确保格式正确
     try:
-        from datetime import datetime
         dt = datetime.strptime(data["date"], "%Y-%m-%d")
         data["date"] = dt.strftime("%Y-%m-%d")  # 强制转为 YYYY-MM-DD (自动补零)
     except (ValueError, TypeError):
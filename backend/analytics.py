@@ -0,0 +1,414 @@
+"""
+内存列式分析引擎（NumPy）
+
+把账单表的分析相关列 (日期, 金额, 收支类型, 分类编码, 入库小时) 加载为 NumPy 数组，
+任意区间统计都转成一次「掩码 + 归约」，不再每个请求扫库再跑 Python 循环。
+写接口提交后调用 apply / discard 增量更新；其他 worker 的写入按 ledger_changes 变更日志增量追平。
+"""
+import calendar
+import json
+import threading
+from datetime import date, datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Receipt, LedgerChange
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+NO_DAY = np.iinfo(np.int32).min          # 日期无法解析的记录，不会落入任何区间
+TYPE_CODES = {"expense": 0, "income": 1}
+
+
+def to_day(value) -> Optional[int]:
+    """'YYYY-MM-DD' / date → 自 1970-01-01 起的天数，无法解析返回 None"""
+    if isinstance(value, date):
+        return value.toordinal() - EPOCH_ORDINAL
+    try:
+        return date.fromisoformat(str(value).strip()).toordinal() - EPOCH_ORDINAL
+    except (ValueError, TypeError):
+        return None
+
+
+def from_day(day: int) -> str:
+    """天数 → 'YYYY-MM-DD'"""
+    return date.fromordinal(int(day) + EPOCH_ORDINAL).isoformat()
+
+
+class ColumnStore:
+    """账单列存储：定长扩容数组 + id 行号索引，删除用墓碑标记"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.change_id = 0          # 已追平到的变更日志 id
+        self._reset(0)
+
+    def _reset(self, capacity: int):
+        capacity = max(capacity, 1024)
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.day = np.full(capacity, NO_DAY, dtype=np.int32)
+        self.amount = np.zeros(capacity, dtype=np.float64)
+        self.type = np.zeros(capacity, dtype=np.int8)
+        self.cat = np.zeros(capacity, dtype=np.int16)
+        self.hour = np.full(capacity, -1, dtype=np.int8)   # 入库时间的小时，-1 表示未知
+        self.live = np.zeros(capacity, dtype=bool)
+        self.categories: list[str] = []
+        self._cat_codes: dict[str, int] = {}
+        self._rows: dict[int, int] = {}
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        for name in ("ids", "day", "amount", "type", "cat", "hour", "live"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            if name == "day":
+                new.fill(NO_DAY)
+            elif name == "hour":
+                new.fill(-1)
+            new[: self.size] = old[: self.size]
+            setattr(self, name, new)
+
+    def category_code(self, category: str) -> int:
+        code = self._cat_codes.get(category)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(category)
+            self._cat_codes[category] = code
+        return code
+
+    def _write_row(self, row: int, rid, date_str, amount, type_, category, created_at):
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        day = to_day(date_str)
+        self.ids[row] = rid
+        self.day[row] = NO_DAY if day is None else day
+        self.amount[row] = amount or 0.0
+        self.type[row] = TYPE_CODES.get(type_, 0)
+        self.cat[row] = self.category_code(category or "其他")
+        self.hour[row] = created_at.hour if isinstance(created_at, datetime) else -1
+        self.live[row] = True
+
+    # ---------- 加载与同步 ----------
+
+    def load(self, db: Session):
+        """从数据库整表加载（只取分析需要的列）"""
+        change_id = db.query(func.max(LedgerChange.id)).scalar() or 0
+        rows = db.query(
+            Receipt.id, Receipt.date, Receipt.amount,
+            Receipt.type, Receipt.category, Receipt.created_at,
+        ).all()
+        with self._lock:
+            self._reset(len(rows) * 2)
+            for i, r in enumerate(rows):
+                self._write_row(i, *r)
+                self._rows[r[0]] = i
+            self.size = len(rows)
+            self.change_id = change_id
+            self._loaded = True
+
+    def ensure_fresh(self, db: Session):
+        """首次查询时整表加载；之后按变更日志增量追平其他进程的写入"""
+        if not self._loaded:
+            self.load(db)
+            return
+        oldest, newest = db.query(func.min(LedgerChange.id), func.max(LedgerChange.id)).one()
+        if not newest or newest <= self.change_id:
+            return
+        if oldest > self.change_id + 1:
+            # 需要的日志已被清理，无法增量追平
+            self.load(db)
+            return
+        changes = (
+            db.query(LedgerChange.id, LedgerChange.op, LedgerChange.payload)
+            .filter(LedgerChange.id > self.change_id)
+            .order_by(LedgerChange.id)
+            .all()
+        )
+        with self._lock:
+            for change_id, op, payload in changes:
+                if change_id <= self.change_id:
+                    continue
+                data = json.loads(payload)
+                if op == "deleted":
+                    self.discard(data["id"])
+                else:
+                    self._upsert(
+                        data["id"], data["date"], data["amount"],
+                        data["type"], data["category"], data["created_at"],
+                    )
+                self.change_id = change_id
+
+    def _upsert(self, rid, date_str, amount, type_, category, created_at):
+        with self._lock:
+            if not self._loaded:
+                return
+            row = self._rows.get(rid)
+            if row is None:
+                if self.size == len(self.ids):
+                    self._grow()
+                row = self.size
+                self.size += 1
+                self._rows[rid] = row
+            self._write_row(row, rid, date_str, amount, type_, category, created_at)
+
+    def apply(self, receipt: Receipt):
+        """新增或修改后同步一条记录"""
+        self._upsert(
+            receipt.id, receipt.date, receipt.amount,
+            receipt.type, receipt.category, receipt.created_at,
+        )
+
+    def discard(self, receipt_id: int):
+        """删除后同步：打墓碑，下次整表重载时回收"""
+        with self._lock:
+            row = self._rows.pop(receipt_id, None)
+            if row is not None:
+                self.live[row] = False
+
+    # ---------- 向量化查询 ----------
+
+    def mask(self, start: int, end: int, type_: Optional[str] = None) -> np.ndarray:
+        """区间 [start, end]（天数）内、指定收支类型的有效记录掩码"""
+        n = self.size
+        day = self.day[:n]
+        m = self.live[:n] & (day >= start) & (day <= end)
+        if type_ is not None:
+            m &= self.type[:n] == TYPE_CODES.get(type_, 0)
+        return m
+
+    def mask_all(self, type_: str) -> np.ndarray:
+        """全部有效记录中指定收支类型的掩码（不限日期）"""
+        n = self.size
+        return self.live[:n] & (self.type[:n] == TYPE_CODES.get(type_, 0))
+
+    def total(self, m: np.ndarray) -> float:
+        return float(self.amount[: self.size][m].sum())
+
+    def by_category(self, m: np.ndarray) -> dict[str, float]:
+        n = self.size
+        sums = np.bincount(self.cat[:n][m], weights=self.amount[:n][m], minlength=len(self.categories))
+        return {self.categories[i]: float(v) for i, v in enumerate(sums) if v}
+
+    def daily(self, m: np.ndarray, start: int, end: int) -> np.ndarray:
+        """[start, end] 每天的金额合计，长度 end - start + 1"""
+        n = self.size
+        return np.bincount(
+            self.day[:n][m] - start, weights=self.amount[:n][m], minlength=end - start + 1,
+        )
+
+    def by_month(self, m: np.ndarray) -> np.ndarray:
+        """按自然月（1-12 → 下标 0-11）合计"""
+        n = self.size
+        month = self.day[:n][m].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) % 12
+        return np.bincount(month, weights=self.amount[:n][m], minlength=12)
+
+    def by_weekday(self, m: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """周一=0 … 周日=6（1970-01-01 是周四）"""
+        n = self.size
+        weekday = (self.day[:n][m].astype(np.int64) + 3) % 7
+        return (
+            np.bincount(weekday, weights=self.amount[:n][m], minlength=7),
+            np.bincount(weekday, minlength=7),
+        )
+
+    def by_hour(self, m: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        n = self.size
+        m = m & (self.hour[:n] >= 0)
+        hour = self.hour[:n][m].astype(np.int64)
+        return (
+            np.bincount(hour, weights=self.amount[:n][m], minlength=24),
+            np.bincount(hour, minlength=24),
+        )
+
+
+# 进程内单例（每个 gunicorn worker 各一份）
+store = ColumnStore()
+
+
+def shift_months(d: date, months: int) -> date:
+    """按月平移日期，月末自动截断（如 3-31 前移一月 → 2-28/29）"""
+    total = d.year * 12 + d.month - 1 + months
+    year, month = total // 12, total % 12 + 1
+    return date(year, month, min(d.day, calendar.monthrange(year, month)[1]))
+
+
+def _category_rows(current: dict[str, float], previous: dict[str, float]) -> list[dict]:
+    rows = []
+    for cat in sorted(set(current) | set(previous), key=lambda c: -current.get(c, 0)):
+        cur, prev = current.get(cat, 0.0), previous.get(cat, 0.0)
+        rows.append({
+            "category": cat,
+            "current": round(cur, 2),
+            "previous": round(prev, 2),
+            "change": round(cur - prev, 2),
+            "change_pct": round((cur - prev) / prev * 100, 1) if prev > 0 else None,
+        })
+    return rows
+
+
+def range_stats(start: date, end: date, store: ColumnStore = store) -> dict:
+    """任意区间的收支合计与支出分类"""
+    s, e = to_day(start), to_day(end)
+    with store._lock:
+        expense_mask = store.mask(s, e, "expense")
+        total_expense = store.total(expense_mask)
+        total_income = store.total(store.mask(s, e, "income"))
+        category_map = store.by_category(expense_mask)
+    by_category = [
+        {
+            "category": cat,
+            "amount": round(amt, 2),
+            "percentage": round(amt / total_expense * 100, 1) if total_expense > 0 else 0,
+        }
+        for cat, amt in sorted(category_map.items(), key=lambda x: -x[1])
+    ]
+    return {
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "total_expense": round(total_expense, 2),
+        "total_income": round(total_income, 2),
+        "balance": round(total_income - total_expense, 2),
+        "by_category": by_category,
+    }
+
+
+def rolling(start: date, end: date, window: int, type_: str, store: ColumnStore = store) -> dict:
+    """[start, end] 每天的滚动 window 天合计（用前缀和一次算完）"""
+    s, e = to_day(start), to_day(end)
+    lo = s - window + 1
+    with store._lock:
+        daily = store.daily(store.mask(lo, e, type_), lo, e)
+    prefix = np.concatenate(([0.0], np.cumsum(daily)))
+    sums = np.round(prefix[window:] - prefix[:-window], 2)
+    return {
+        "window": window,
+        "type": type_,
+        "series": [{"date": from_day(s + i), "amount": float(v)} for i, v in enumerate(sums)],
+    }
+
+
+def compare(start: date, end: date, mode: str, type_: str, store: ColumnStore = store) -> dict:
+    """当前区间与对比区间的分类对比：yoy 去年同期 / mom 上月同期 / prev 紧邻的等长区间"""
+    if mode == "yoy":
+        prev_start, prev_end = shift_months(start, -12), shift_months(end, -12)
+    elif mode == "mom":
+        prev_start, prev_end = shift_months(start, -1), shift_months(end, -1)
+    else:
+        span = end.toordinal() - start.toordinal() + 1
+        prev_start = date.fromordinal(start.toordinal() - span)
+        prev_end = date.fromordinal(end.toordinal() - span)
+
+    with store._lock:
+        cur_mask = store.mask(to_day(start), to_day(end), type_)
+        prev_mask = store.mask(to_day(prev_start), to_day(prev_end), type_)
+        cur_total, prev_total = store.total(cur_mask), store.total(prev_mask)
+        cur_cats, prev_cats = store.by_category(cur_mask), store.by_category(prev_mask)
+
+    return {
+        "mode": mode,
+        "type": type_,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "previous_start_date": prev_start.isoformat(),
+        "previous_end_date": prev_end.isoformat(),
+        "current_total": round(cur_total, 2),
+        "previous_total": round(prev_total, 2),
+        "change_pct": round((cur_total - prev_total) / prev_total * 100, 1) if prev_total > 0 else None,
+        "by_category": _category_rows(cur_cats, prev_cats),
+    }
+
+
+def profile(start: date, end: date, type_: str, store: ColumnStore = store) -> dict:
+    """按星期几（交易日期）与小时（入库时间）的消费画像"""
+    with store._lock:
+        m = store.mask(to_day(start), to_day(end), type_)
+        wd_amount, wd_count = store.by_weekday(m)
+        hr_amount, hr_count = store.by_hour(m)
+    return {
+        "type": type_,
+        "weekday": [
+            {"key": i, "amount": round(float(a), 2), "count": int(c)}
+            for i, (a, c) in enumerate(zip(wd_amount, wd_count))
+        ],
+        "hour": [
+            {"key": i, "amount": round(float(a), 2), "count": int(c)}
+            for i, (a, c) in enumerate(zip(hr_amount, hr_count))
+        ],
+    }
+
+
+def ledger_totals(date_str: str, store: ColumnStore = store) -> dict:
+    """某条账单变更后的最新合计：所在月、所在日与全部历史（供 SSE 推送）"""
+    day = to_day(date_str)
+    result = {}
+    with store._lock:
+        if day is not None:
+            d = date.fromordinal(day + EPOCH_ORDINAL)
+            first = to_day(d.replace(day=1))
+            last = to_day(d.replace(day=calendar.monthrange(d.year, d.month)[1]))
+            expense_mask = store.mask(first, last, "expense")
+            result.update({
+                "month": d.strftime("%Y-%m"),
+                "month_expense": round(store.total(expense_mask), 2),
+                "month_income": round(store.total(store.mask(first, last, "income")), 2),
+                "month_by_category": {
+                    cat: round(amt, 2) for cat, amt in store.by_category(expense_mask).items()
+                },
+                "day": d.isoformat(),
+                "day_expense": round(store.total(store.mask(day, day, "expense")), 2),
+            })
+        result["total_income"] = round(store.total(store.mask_all("income")), 2)
+        result["total_expense"] = round(store.total(store.mask_all("expense")), 2)
+    return result
+
+
+def month_stats(year: int, month: int, store: ColumnStore = store) -> dict:
+    """与 /api/get_stats 同构的月度统计"""
+    start = date(year, month, 1)
+    end = date(year, month, calendar.monthrange(year, month)[1])
+    first, last = to_day(start), to_day(end)
+    with store._lock:
+        stats = range_stats(start, end, store)
+        m = store.mask(first, last, "expense")
+        counts = np.bincount(store.day[: store.size][m] - first, minlength=last - first + 1)
+        daily = store.daily(m, first, last)
+    return {
+        "total_expense": stats["total_expense"],
+        "total_income": stats["total_income"],
+        "balance": stats["balance"],
+        "by_category": stats["by_category"],
+        "daily_expense": [
+            {"date": from_day(first + i), "amount": round(float(daily[i]), 2)}
+            for i in np.flatnonzero(counts)
+        ],
+    }
+
+
+def yearly(year: int, store: ColumnStore = store) -> dict:
+    """与 /api/get_yearly 同构的年度按月汇总"""
+    first, last = to_day(date(year, 1, 1)), to_day(date(year, 12, 31))
+    with store._lock:
+        income = store.by_month(store.mask(first, last, "income"))
+        expense = store.by_month(store.mask(first, last, "expense"))
+    return {
+        "year": year,
+        "monthly": [
+            {
+                "month": i + 1,
+                "income": round(float(income[i]), 2),
+                "expense": round(float(expense[i]), 2),
+                "balance": round(float(income[i] - expense[i]), 2),
+            }
+            for i in range(12)
+        ],
+    }
+
+
+def lifetime_totals(store: ColumnStore = store) -> tuple[float, float]:
+    """全部历史的 (总收入, 总支出)"""
+    with store._lock:
+        return store.total(store.mask_all("income")), store.total(store.mask_all("expense"))
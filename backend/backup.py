@@ -0,0 +1,211 @@
+"""
+在线备份与恢复（SQLite backup API）
+
+按 BACKUP_PAGES 页一步复制，步与步之间让出写锁，备份大账本时上传请求不会被卡住；
+可选 gzip 压缩，只保留最近 BACKUP_KEEP 份快照。
+
+用法（多账本模式下加 --ledger <id> 操作指定账本，默认为默认账本）:
+    python backup.py create [--no-compress] [--keep N]
+    python backup.py create --all       # 依次备份全部账本（定时任务用）
+    python backup.py list
+    python backup.py restore <快照文件名> [--yes]     # 建议先停服务
+
+定时备份见 deploy/bookkeeping-backup.timer。
+"""
+import argparse
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from database import DATA_DIR, engine
+import ledgers
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(DATA_DIR, "backups"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", 14))
+BACKUP_PAGES = 256       # 每步复制的页数（默认页大小 4KB → 每步约 1MB）
+BACKUP_SLEEP = 0.005     # 每步之间让出写锁的时间（秒）
+PREFIX = "bookkeeping-"
+
+# 快照文件名：默认账本 bookkeeping-<时间>.db[.gz]，其他账本 ledger-<id>.<时间>.db[.gz]
+# 账本 id 不含 "."，按整名解析出 id 再比较，ledger-a.* 与 ledger-a-b.* 不会互相匹配；
+# 早期版本以 "-" 分隔（ledger-<id>-<时间>），时间格式固定，同样能无歧义地解析
+_SNAPSHOT = re.compile(
+    r"^(?:bookkeeping-|ledger-(?P<ledger>[a-z0-9][a-z0-9_-]{0,31})[.-])\d{8}-\d{6}\.db(?:\.gz)?$"
+)
+
+
+def _snapshot_name(ledger_id: str, stamp: str) -> str:
+    return f"{PREFIX}{stamp}.db" if ledger_id == ledgers.DEFAULT else f"ledger-{ledger_id}.{stamp}.db"
+
+
+def _snapshot_ledger(name: str) -> Optional[str]:
+    """快照文件名 → 所属账本 id（不是快照文件时为 None）"""
+    match = _SNAPSHOT.match(name)
+    if not match:
+        return None
+    return match.group("ledger") or ledgers.DEFAULT
+
+
+def _db_path(ledger_id: str) -> str:
+    if ledger_id != ledgers.DEFAULT:
+        path = ledgers.database_path(ledger_id)
+        if not os.path.isfile(path):
+            raise ValueError(f"账本不存在: {ledger_id}")
+        return path
+    if engine.url.get_backend_name() != "sqlite" or not engine.url.database:
+        raise ValueError("在线备份仅支持 SQLite 文件数据库，PostgreSQL 请使用 pg_dump")
+    return engine.url.database
+
+
+def _copy(src: sqlite3.Connection, dst: sqlite3.Connection):
+    src.backup(dst, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP)
+
+
+def list_backups(ledger_id: str = ledgers.DEFAULT) -> list[dict]:
+    """按时间倒序列出某账本的快照"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    items = []
+    for name in os.listdir(BACKUP_DIR):
+        if _snapshot_ledger(name) == ledger_id:
+            path = os.path.join(BACKUP_DIR, name)
+            items.append({
+                "name": name,
+                "size": os.path.getsize(path),
+                "created_at": datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds"),
+            })
+    # 按文件名中的时间排序（新旧两种分隔符的文件名混排时也正确）
+    return sorted(items, key=lambda x: x["name"].split(".db")[0][-15:], reverse=True)
+
+
+def _prune(keep: int, ledger_id: str) -> list[str]:
+    removed = []
+    for item in list_backups(ledger_id)[keep:]:
+        os.remove(os.path.join(BACKUP_DIR, item["name"]))
+        removed.append(item["name"])
+    return removed
+
+
+def create_backup(compress: bool = True, keep: int = BACKUP_KEEP, ledger_id: str = ledgers.DEFAULT) -> dict:
+    """
+    创建一份快照
+
+    Returns:
+        dict: name, size, seconds, removed（因超出保留份数被删除的旧快照）
+    """
+    db_path = _db_path(ledger_id)
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    started = time.perf_counter()
+    name = _snapshot_name(ledger_id, datetime.now().strftime('%Y%m%d-%H%M%S'))
+
+    # 先写到同目录临时文件，完成后再改名，避免留下半截快照
+    fd, tmp_path = tempfile.mkstemp(dir=BACKUP_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            _copy(src, dst)
+        finally:
+            dst.close()
+            src.close()
+
+        if compress:
+            name += ".gz"
+            gz_path = tmp_path + ".gz"
+            with open(tmp_path, "rb") as f_in, gzip.open(gz_path, "wb", compresslevel=6) as f_out:
+                shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+            os.remove(tmp_path)
+            tmp_path = gz_path
+        final_path = os.path.join(BACKUP_DIR, name)
+        os.replace(tmp_path, final_path)
+    except BaseException:
+        for path in (tmp_path, tmp_path + ".gz"):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    return {
+        "name": name,
+        "size": os.path.getsize(final_path),
+        "seconds": round(time.perf_counter() - started, 2),
+        "removed": _prune(keep, ledger_id),
+    }
+
+
+def restore_backup(name: str, ledger_id: str = ledgers.DEFAULT):
+    """用快照覆盖账本数据库（同样走 backup API，按页写入，持有写锁期间其他写入会等待）"""
+    path = os.path.join(BACKUP_DIR, os.path.basename(name))
+    if not os.path.isfile(path):
+        raise ValueError(f"快照不存在: {name}")
+    if _snapshot_ledger(os.path.basename(name)) != ledger_id:
+        raise ValueError(f"{name} 不是账本 {ledger_id} 的快照")
+    db_path = _db_path(ledger_id)
+
+    tmp_path = None
+    if path.endswith(".gz"):
+        fd, tmp_path = tempfile.mkstemp(dir=BACKUP_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f_out, gzip.open(path, "rb") as f_in:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        path = tmp_path
+    try:
+        src = sqlite3.connect(path)
+        dst = sqlite3.connect(db_path)
+        try:
+            _copy(src, dst)
+        finally:
+            dst.close()
+            src.close()
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="账本在线备份 / 恢复")
+    parser.add_argument("--ledger", default=ledgers.DEFAULT, help="账本 id（多账本模式）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_create = sub.add_parser("create", help="创建快照")
+    p_create.add_argument("--no-compress", action="store_true", help="不压缩")
+    p_create.add_argument("--keep", type=int, default=BACKUP_KEEP, help="保留最近几份快照")
+    p_create.add_argument("--all", action="store_true", help="备份全部账本（忽略 --ledger）")
+    sub.add_parser("list", help="列出快照")
+    p_restore = sub.add_parser("restore", help="从快照恢复")
+    p_restore.add_argument("name", help="快照文件名")
+    p_restore.add_argument("--yes", action="store_true", help="跳过确认")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        failed = []
+        for ledger_id in (ledgers.list_ids() if args.all else [args.ledger]):
+            try:
+                info = create_backup(compress=not args.no_compress, keep=args.keep, ledger_id=ledger_id)
+            except (ValueError, sqlite3.Error) as e:
+                # --all 时单个账本失败不影响其余账本
+                print(f"❌ 备份失败 [{ledger_id}]: {e}")
+                failed.append(ledger_id)
+                continue
+            print(f"✅ 已备份: {info['name']} ({info['size'] / 1024:.1f} KB, {info['seconds']}s)")
+            for name in info["removed"]:
+                print(f"🗑️ 已清理旧快照: {name}")
+        if failed:
+            raise SystemExit(1)
+    elif args.command == "list":
+        for item in list_backups(args.ledger):
+            print(f"{item['name']}  {item['size'] / 1024:10.1f} KB  {item['created_at']}")
+    elif args.command == "restore":
+        if not args.yes:
+            answer = input(f"将用 {args.name} 覆盖当前数据库，建议先停止服务。继续？[y/N] ")
+            if answer.strip().lower() != "y":
+                raise SystemExit("已取消")
+        restore_backup(args.name, args.ledger)
+        print(f"✅ 已恢复: {args.name}，请重启服务（systemctl restart bookkeeping）")
@@ -0,0 +1,114 @@
+"""
+基准测试：列表 / 导出接口的序列化开销（旧路径 vs orjson 快速路径）
+
+用法: python bench_responses.py [记录条数，默认 20000]
+在临时 SQLite 库中造数据，进程内用 TestClient 压测，不影响 data/bookkeeping.db。
+两条路径都经过 GZipMiddleware，差异只来自查询与序列化。
+"""
+import os
+import sys
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix="bookkeeping-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import Depends, Query
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+import main
+from database import SessionLocal, get_db
+from models import Receipt
+from schemas import ReceiptData, ReceiptListResponse
+
+CATEGORIES = ["餐饮", "交通", "购物", "娱乐", "医疗", "教育", "住房", "通讯", "其他"]
+
+
+# ---------- 旧路径：ORM 对象 → to_dict() → ReceiptData → response_model 二次校验 → 标准库 json ----------
+
+@main.app.get("/bench/legacy/receipts", response_model=ReceiptListResponse)
+def legacy_receipts(
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=20, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    query = db.query(Receipt)
+    total = query.count()
+    items = (
+        query.order_by(Receipt.date.desc(), Receipt.id.desc())
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+        .all()
+    )
+    return ReceiptListResponse(
+        total=total, page=page, page_size=page_size,
+        items=[ReceiptData(**r.to_dict()) for r in items],
+    )
+
+
+@main.app.get("/bench/legacy/export", response_model=list[ReceiptData])
+def legacy_export(db: Session = Depends(get_db)):
+    items = db.query(Receipt).order_by(Receipt.date.desc(), Receipt.id.desc()).all()
+    return [ReceiptData(**r.to_dict()) for r in items]
+
+
+def seed(n: int):
+    db = SessionLocal()
+    db.bulk_insert_mappings(Receipt, [
+        {
+            "date": f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "merchant": f"商户{i % 500}",
+            "amount": round(5 + (i * 7919 % 50000) / 100, 2),
+            "type": "income" if i % 20 == 0 else "expense",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+        }
+        for i in range(n)
+    ])
+    db.commit()
+    db.close()
+
+
+def bench(client: TestClient, url: str, params: dict, seconds: float) -> tuple[float, int, int]:
+    """返回 (每秒请求数, 响应体字节数, gzip 后传输字节数)"""
+    r = client.get(url, params=params)
+    r.raise_for_status()
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        client.get(url, params=params)
+        count += 1
+    wire = int(r.headers.get("content-length", len(r.content)))
+    return count / (time.perf_counter() - start), len(r.content), wire
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print("=" * 60)
+    print(f"序列化基准测试（{n} 条记录）")
+    print("=" * 60)
+
+    with TestClient(main.app) as client:
+        seed(n)
+        # 两条路径结果须一致，否则比较的不是同一份工作；带筛选的计数也要正确
+        legacy_total = client.get("/bench/legacy/receipts").json()["total"]
+        fast_total = client.get("/api/receipts").json()["total"]
+        assert legacy_total == fast_total == n, (legacy_total, fast_total)
+        income_total = client.get("/api/receipts", params={"type": "income"}).json()["total"]
+        assert income_total == len(range(0, n, 20)), income_total
+        cases = [
+            ("列表 100 条/页", "/bench/legacy/receipts", "/api/receipts", {"page": 3, "page_size": 100}, 3.0),
+            ("JSON 全量导出", "/bench/legacy/export", "/api/receipts/export", {"format": "json"}, 5.0),
+        ]
+        for label, legacy_url, fast_url, params, seconds in cases:
+            legacy_params = {k: v for k, v in params.items() if k != "format"}
+            legacy_rps, legacy_size, _ = bench(client, legacy_url, legacy_params, seconds)
+            fast_rps, fast_size, wire_size = bench(client, fast_url, params, seconds)
+            print(f"\n[{label}]")
+            print(f"  旧路径:   {legacy_rps:8.1f} req/s  {legacy_size / 1024:8.1f} KB")
+            print(f"  快速路径: {fast_rps:8.1f} req/s  {fast_size / 1024:8.1f} KB  (x{fast_rps / legacy_rps:.2f})")
+            print(f"  gzip 传输:                   {wire_size / 1024:8.1f} KB")
+
+    print("\n" + "=" * 60)
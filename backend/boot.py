@@ -0,0 +1,75 @@
+"""
+启动耗时统计
+
+main.py 在各启动阶段调用 mark()，/api/startup 与 `python boot.py` 输出分阶段耗时，
+后者另外用 `python -X importtime` 列出导入最慢的模块。
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+
+_started = time.perf_counter()
+_last = _started
+stages: list[tuple[str, float]] = []   # (阶段, 毫秒)
+prepared = False                       # init_db / 数据修复 / 预加载是否已完成
+preloaded = False                      # 是否在 gunicorn master 中完成（--preload）
+
+
+def mark(label: str):
+    """记录从上一个 mark 到现在的耗时"""
+    global _last
+    now = time.perf_counter()
+    stages.append((label, round((now - _last) * 1000, 1)))
+    _last = now
+
+
+def report() -> dict:
+    return {
+        "pid": os.getpid(),
+        "preloaded": preloaded,
+        "total_ms": round(sum(ms for _, ms in stages), 1),
+        "stages": [{"stage": label, "ms": ms} for label, ms in stages],
+    }
+
+
+def import_costs(top: int = 15) -> list[tuple[str, float]]:
+    """在子进程中 `import main`，按累计导入耗时返回 main 直接导入的最慢模块 [(模块, 毫秒)]"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True,
+    )
+    # 每行: "import time: <self us> | <cumulative us> | <缩进><模块>"，子模块先于父模块输出
+    pattern = re.compile(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|( *)(\S+)")
+    rows = [(len(m.group(2)), m.group(3), int(m.group(1)) / 1000)
+            for m in map(pattern.match, result.stderr.splitlines()) if m]
+    main_idx = next((i for i, r in enumerate(rows) if r[1] == "main"), None)
+    if main_idx is None:
+        return []
+    main_depth = rows[main_idx][0]
+    children = []
+    for depth, name, ms in reversed(rows[:main_idx]):
+        if depth <= main_depth:
+            break
+        if depth == main_depth + 2:
+            children.append((name, ms))
+    return sorted(children, key=lambda x: -x[1])[:top]
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main
+    import boot as registry   # main 记录的是 boot 模块里的数据，而不是这里的 __main__
+
+    main.prepare()
+    info = registry.report()
+    print("=" * 50)
+    print(f"启动耗时（共 {info['total_ms']} ms）")
+    print("=" * 50)
+    for item in info["stages"]:
+        print(f"  {item['stage']:<28} {item['ms']:>8.1f} ms")
+    print("\n最慢的导入（main 直接导入的模块，python -X importtime）")
+    for name, ms in import_costs():
+        print(f"  {name:<28} {ms:>8.1f} ms")
@@ -0,0 +1,133 @@
+"""
+分类预算
+
+budget_spend 表按 (月份, 分类) 保存累计支出，账单新增/修改/删除时在同一事务里
+用一条 upsert 增量调整，并据此 O(1) 判断是否跨过 80% / 100% 阈值，无需再扫整月账单。
+"""
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import insert, month_of
+from models import Receipt, Budget, BudgetSpend
+
+THRESHOLDS = (80, 100)   # 提醒阈值（%）
+
+
+def snapshot(receipt: Receipt) -> Optional[tuple[str, str, float]]:
+    """账单对预算的贡献：(月份, 分类, 金额)，收入不计入。修改/删除前先记下旧值"""
+    if receipt.type != "expense" or not receipt.date:
+        return None
+    return receipt.date.strip()[:7], receipt.category, receipt.amount or 0.0
+
+
+def _add(db: Session, month: str, category: str, delta: float) -> float:
+    """原子累加并返回累加后的支出"""
+    stmt = (
+        insert(BudgetSpend)
+        .values(month=month, category=category, spent=delta)
+        .on_conflict_do_update(
+            index_elements=[BudgetSpend.month, BudgetSpend.category],
+            set_={"spent": BudgetSpend.spent + delta},
+        )
+        .returning(BudgetSpend.spent)
+    )
+    return db.execute(stmt).scalar_one()
+
+
+def _alert(db: Session, month: str, category: str, before: float, after: float) -> Optional[str]:
+    budget = db.get(Budget, category)
+    if not budget or budget.amount <= 0:
+        return None
+    before_pct = before / budget.amount * 100
+    after_pct = after / budget.amount * 100
+    crossed = [t for t in THRESHOLDS if before_pct < t <= after_pct]
+    if not crossed:
+        return None
+    suffix = "" if month == date.today().strftime("%Y-%m") else f"（{month}）"
+    if crossed[-1] >= 100:
+        return f"🚨 {category}预算已超支：已用 {after_pct:.0f}%{suffix}"
+    return f"⚠️ {category}预算已用 {after_pct:.0f}%{suffix}"
+
+
+def apply_change(
+    db: Session,
+    old: Optional[tuple[str, str, float]],
+    new: Optional[Receipt],
+) -> list[str]:
+    """
+    在当前事务中调整累计支出（调用方 commit）
+
+    Args:
+        old: 修改/删除前的 snapshot()，新增时为 None
+        new: 新增/修改后的账单，删除时为 None
+
+    Returns:
+        list[str]: 本次写入触发的预算提醒
+    """
+    new_key = snapshot(new) if new is not None else None
+    if old == new_key:
+        return []
+    if old is not None:
+        _add(db, old[0], old[1], -old[2])
+    if new_key is None:
+        return []
+    month, category, amount = new_key
+    after = _add(db, month, category, amount)
+    before = after - amount
+    if old is not None and old[:2] == (month, category):
+        before += old[2]   # 同月同分类修改：以修改前的累计为基准
+    alert = _alert(db, month, category, before, after)
+    return [alert] if alert else []
+
+
+def rebuild(db: Session):
+    """按账单表重建累计支出（首次启用或数据修复后）"""
+    db.query(BudgetSpend).delete()
+    month = month_of(Receipt.date)
+    rows = (
+        db.query(month, Receipt.category, func.sum(Receipt.amount))
+        .filter(Receipt.type == "expense")
+        .group_by(month, Receipt.category)
+        .all()
+    )
+    db.add_all(BudgetSpend(month=m, category=c, spent=s or 0.0) for m, c, s in rows)
+    db.commit()
+
+
+def ensure_rollup(db: Session, force: bool = False):
+    """启动时调用：累计表为空而账单表有数据时回填"""
+    if not force:
+        if db.query(BudgetSpend.month).first() is not None:
+            return
+        if db.query(Receipt.id).first() is None:
+            return
+    try:
+        rebuild(db)
+    except IntegrityError:
+        # 另一个 worker 同时在回填
+        db.rollback()
+
+
+def month_status(db: Session, month: str) -> list[dict]:
+    """某月各预算分类的使用情况"""
+    budgets = db.query(Budget).order_by(Budget.category).all()
+    spent = dict(
+        db.query(BudgetSpend.category, BudgetSpend.spent)
+        .filter(BudgetSpend.month == month)
+        .all()
+    )
+    items = []
+    for b in budgets:
+        s = round(max(spent.get(b.category, 0.0), 0.0), 2)
+        items.append({
+            "category": b.category,
+            "budget": round(b.amount, 2),
+            "spent": s,
+            "remaining": round(b.amount - s, 2),
+            "percentage": round(s / b.amount * 100, 1) if b.amount > 0 else 0,
+        })
+    return items
@@ -0,0 +1,95 @@
+"""
+自检：按需剖析在当前 Python 版本下可用
+
+用法: python check_profiling.py
+在临时目录中建库、开启 PROFILE_TOKEN，进程内用 TestClient 请求同步接口、异步接口和并发请求，
+确认都返回 200 并生成含 cProfile 函数表的剖析结果。
+Python 3.12 起 cProfile 基于 sys.monitoring，同一进程同时启用两个 Profile 会抛 ValueError，
+本脚本覆盖这一情况；失败时退出码非 0。
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+_tmp_dir = tempfile.mkdtemp(prefix="bookkeeping-profile-check-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'check.db')}"
+os.environ["PROFILE_TOKEN"] = "check-token"
+os.environ["PROFILE_DIR"] = os.path.join(_tmp_dir, "profiles")
+os.environ.pop("PROFILE_SLOW_MS", None)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import APIRouter
+from fastapi.testclient import TestClient
+
+import main
+import profiling
+
+HEADERS = {"X-Profile-Token": "check-token"}
+
+check_router = APIRouter(route_class=profiling.route_class())
+
+
+@check_router.get("/check/async")
+async def async_endpoint():
+    await asyncio.sleep(0.01)
+    return {"sum": sum(range(10000))}
+
+
+main.app.include_router(check_router)
+
+
+def _latest(path: str) -> dict:
+    items = [p for p in profiling.list_profiles() if p["path"] == path]
+    if not items:
+        raise AssertionError(f"{path} 没有生成剖析结果")
+    return profiling.load_profile(items[0]["name"])
+
+
+def main_check() -> int:
+    failures = []
+    print("=" * 60)
+    print(f"剖析自检（Python {sys.version.split()[0]}）")
+    print("=" * 60)
+
+    with TestClient(main.app, raise_server_exceptions=False) as client:
+        cases = [
+            ("同步接口", "/api/get_stats", {"year": 2026, "month": 2}),
+            ("同步接口（账本前缀）", "/api/ledgers/default/get_yearly", {"year": 2026}),
+            ("异步接口", "/check/async", {}),
+        ]
+        for label, path, params in cases:
+            r = client.get(path, params=params, headers=HEADERS)
+            ok = r.status_code == 200
+            detail = f"HTTP {r.status_code}"
+            if ok:
+                data = _latest(path)
+                ok = bool(data["functions"])
+                detail += f"，SQL {data['sql_count']} 条，函数表{'有' if ok else '缺失'}"
+            print(f"  {'✅' if ok else '❌'} {label:<12} {path}  {detail}")
+            if not ok:
+                failures.append(path)
+
+        # 并发：同一时间只有一个请求能拿到 cProfile，其他请求照常返回并记录 SQL 耗时
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            codes = list(pool.map(
+                lambda _: client.get("/api/get_stats", params={"year": 2026, "month": 2}, headers=HEADERS).status_code,
+                range(16),
+            ))
+        ok = all(code == 200 for code in codes)
+        print(f"  {'✅' if ok else '❌'} 并发 16 个剖析请求  {codes.count(200)}/16 成功")
+        if not ok:
+            failures.append("concurrent")
+
+    print("=" * 60)
+    if failures:
+        print(f"❌ 失败: {json.dumps(failures, ensure_ascii=False)}")
+        return 1
+    print("✅ 全部通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_check())
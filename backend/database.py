@@ -2,7 +2,8 @@
 数据库连接与初始化模块
 """
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
 # 确保 data 目录存在
@@ -10,12 +11,36 @@ DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(DATA_DIR, 'bookkeeping.db')}")
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},  # SQLite 需要
-    echo=False,
-)
+
+def make_engine(url: str):
+    """按方言创建 engine（默认账本与多账本模式下的各账本文件共用）"""
+    if make_url(url).get_backend_name() == "sqlite":
+        return create_engine(
+            url,
+            connect_args={"check_same_thread": False},  # SQLite 需要
+            echo=False,
+        )
+    # 连接池按 worker 计：WEB_CONCURRENCY × (DB_POOL_SIZE + DB_MAX_OVERFLOW) 不应超过服务端 max_connections
+    return create_engine(
+        url,
+        pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 5)),
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", 10)),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),  # 早于服务端/中间件的空闲断开
+        pool_pre_ping=True,                                      # 数据库重启后自动换掉失效连接
+        echo=False,
+    )
+
+
+engine = make_engine(DATABASE_URL)
+
+# 带 ON CONFLICT 的 INSERT（upsert）：两种方言的接口一致
+if IS_SQLITE:
+    from sqlalchemy.dialects.sqlite import insert  # noqa: E402
+else:
+    from sqlalchemy.dialects.postgresql import insert  # noqa: E402, F401
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -24,6 +49,13 @@ class Base(DeclarativeBase):
     pass
 
 
+def month_of(column):
+    """日期列 → 'YYYY-MM' 月份键的 SQL 表达式（Postgres 用 date_trunc，SQLite 日期为文本取前 7 位）"""
+    if IS_SQLITE:
+        return func.substr(column, 1, 7)
+    return func.to_char(func.date_trunc("month", column), "YYYY-MM")
+
+
 def get_db():
     """FastAPI 依赖注入：获取数据库会话"""
     db = SessionLocal()
@@ -33,7 +65,26 @@ def get_db():
         db.close()
 
 
-def init_db():
-    """初始化数据库，创建所有表"""
-    from models import Receipt, Setting  # noqa: F401
-    Base.metadata.create_all(bind=engine)
+def init_db(bind=None):
+    """初始化数据库（默认 engine 或指定账本的 engine），创建所有表，并为已有表补上新增的列与索引"""
+    from models import (  # noqa: F401
+        Receipt, Setting, LedgerChange, UploadClaim, Budget, BudgetSpend, Merchant, MerchantAlias,
+    )
+    bind = bind if bind is not None else engine
+    Base.metadata.create_all(bind=bind)
+    _add_missing_columns(bind)
+
+
+def _add_missing_columns(bind):
+    """create_all 不会修改已有表：对照模型补齐缺失的可空列和索引（轻量迁移）"""
+    from sqlalchemy import inspect
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    col_type = column.type.compile(dialect=bind.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}")
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
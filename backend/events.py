@@ -0,0 +1,219 @@
+"""
+账本变更推送（Server-Sent Events）
+
+写接口在提交账单的同一事务里追加一条 ledger_changes 记录；
+每个 gunicorn worker 运行一个 ChangeFeed 轮询该表，把新变更连同最新合计
+分发给本进程的 SSE 订阅者。变更日志在 SQLite 文件里，因此天然跨 worker。
+多账本模式下每个已打开的账本各有一个 ChangeFeed（见 ledgers.py）。
+"""
+import asyncio
+import json
+from typing import Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from database import IS_SQLITE, SessionLocal
+from models import Receipt, LedgerChange
+import analytics
+
+POLL_INTERVAL = 1.0         # 轮询间隔（秒），本进程写入会立即唤醒
+HEARTBEAT_INTERVAL = 15.0   # SSE 心跳间隔（秒），避免 Nginx 断开空闲连接
+KEEP_CHANGES = 5000         # 变更日志保留条数
+QUEUE_SIZE = 256            # 单个订阅者积压上限，超出即断开让客户端重连
+CHANGE_LOCK_KEY = 0x6C656467  # PostgreSQL 事务级咨询锁的键，串行化变更日志写入
+
+
+def record_change(db: Session, op: str, receipt: Receipt):
+    """在当前事务中记录一条账单变更（调用方负责 flush 出 id 与 commit）
+
+    读取方按 id 游标增量消费。PostgreSQL 的序列号在 INSERT 时分配、提交顺序却不定，
+    后分配的 id 先提交会让游标越过尚未可见的较小 id 而永久漏掉它；
+    因此先取事务级咨询锁，持有到提交/回滚为止，保证变更日志按 id 顺序提交。
+    SQLite 写事务本身是串行的，无需加锁。
+    """
+    if not IS_SQLITE:
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CHANGE_LOCK_KEY})
+    db.add(LedgerChange(
+        op=op,
+        receipt_id=receipt.id,
+        payload=json.dumps(receipt.to_dict(), ensure_ascii=False),
+    ))
+
+
+def format_event(change_id: int, data: dict) -> str:
+    """编码为一条 SSE 消息"""
+    return f"id: {change_id}\nevent: receipt\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _load_changes(session_factory, store: analytics.ColumnStore, after_id: int) -> list[tuple[int, dict]]:
+    """读取 after_id 之后的变更，并附上本进程分析引擎算出的最新合计"""
+    db = session_factory()
+    try:
+        rows = (
+            db.query(LedgerChange.id, LedgerChange.op, LedgerChange.payload)
+            .filter(LedgerChange.id > after_id)
+            .order_by(LedgerChange.id)
+            .all()
+        )
+        if not rows:
+            return []
+        store.ensure_fresh(db)
+        events = []
+        for change_id, op, payload in rows:
+            receipt = json.loads(payload)
+            events.append((change_id, {
+                "op": op,
+                "receipt": receipt,
+                "totals": analytics.ledger_totals(receipt.get("date"), store),
+            }))
+        return events
+    finally:
+        db.close()
+
+
+def _latest_change_id(session_factory) -> int:
+    db = session_factory()
+    try:
+        return db.query(func.max(LedgerChange.id)).scalar() or 0
+    finally:
+        db.close()
+
+
+def prune_changes(session_factory):
+    """只保留最近 KEEP_CHANGES 条变更日志
+
+    默认账本由常驻的 ChangeFeed 定期调用；其他账本的 ChangeFeed 只在有 SSE 订阅者时运行，
+    由 ledgers 在打开账本与定期清扫时调用。
+    """
+    db = session_factory()
+    try:
+        newest = db.query(func.max(LedgerChange.id)).scalar() or 0
+        if newest > KEEP_CHANGES:
+            db.query(LedgerChange).filter(LedgerChange.id <= newest - KEEP_CHANGES).delete()
+            db.commit()
+    finally:
+        db.close()
+
+
+class ChangeFeed:
+    """单进程内的变更分发器：一个轮询任务 → 多个订阅队列"""
+
+    def __init__(self, session_factory=SessionLocal, store: analytics.ColumnStore = analytics.store):
+        self._session_factory = session_factory
+        self._store = store
+        self._subscribers: set[asyncio.Queue] = set()
+        self._last_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def close(self):
+        """账本被逐出缓存时停止轮询（可在线程池中调用）"""
+        if self._task and self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        self._task = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def notify(self):
+        """本进程提交了变更：立即唤醒轮询（可在线程池中调用）"""
+        if self._loop and self._wake and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    async def _run(self):
+        polls = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self._poll()
+                polls += 1
+                if polls % 600 == 0:
+                    await asyncio.to_thread(prune_changes, self._session_factory)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Change feed poll failed: {e}")
+
+    async def _poll(self):
+        if not self._subscribers:
+            # 无人订阅时不读日志，下次有订阅者时从当时的最新位置开始
+            self._last_id = None
+            return
+        if self._last_id is None:
+            self._last_id = await asyncio.to_thread(_latest_change_id, self._session_factory)
+        events = await asyncio.to_thread(_load_changes, self._session_factory, self._store, self._last_id)
+        for change_id, data in events:
+            message = format_event(change_id, data)
+            for queue in list(self._subscribers):
+                try:
+                    queue.put_nowait((change_id, message))
+                except asyncio.QueueFull:
+                    # 消费太慢：放入 None 让该连接结束，客户端会带 Last-Event-ID 重连补齐
+                    self._subscribers.discard(queue)
+                    queue.get_nowait()
+                    queue.put_nowait(None)
+            self._last_id = change_id
+
+    async def stream(self, last_event_id: Optional[int] = None):
+        """单个 SSE 连接的消息生成器；带 Last-Event-ID 时先补发断线期间的变更"""
+        if self._task is None:
+            # 非默认账本的推送在第一个订阅者到来时才启动
+            await self.start()
+        queue = self.subscribe()
+        if self._last_id is None:
+            self._last_id = await asyncio.to_thread(_latest_change_id, self._session_factory)
+        sent_id = 0
+        try:
+            yield "retry: 3000\n\n"
+            if last_event_id is not None:
+                for change_id, data in await asyncio.to_thread(
+                    _load_changes, self._session_factory, self._store, last_event_id,
+                ):
+                    sent_id = change_id
+                    yield format_event(change_id, data)
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    break
+                change_id, message = item
+                if change_id > sent_id:
+                    yield message
+        finally:
+            self.unsubscribe(queue)
+
+
+# 进程内单例（每个 gunicorn worker 各一份）
+feed = ChangeFeed()
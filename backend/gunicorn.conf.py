@@ -0,0 +1,32 @@
+"""
+gunicorn 配置：gunicorn -c gunicorn.conf.py main:app
+
+preload_app 让 master 先导入应用并执行 main.prepare()（建表、数据修复、分析引擎加载），
+worker fork 后共享这些只读状态，重启 / 扩容时第一个请求无需再等初始化。
+"""
+import os
+
+bind = os.getenv("BIND", "127.0.0.1:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+
+
+def on_starting(server):
+    """master 中执行一次性启动工作，完成后关闭 master 持有的数据库连接"""
+    import boot
+    import main
+    from database import engine
+
+    main.prepare()
+    boot.preloaded = True
+    engine.dispose()
+    server.log.info("Preloaded app in %.1f ms: %s", boot.report()["total_ms"],
+                    ", ".join(f"{s['stage']} {s['ms']}ms" for s in boot.report()["stages"]))
+
+
+def post_fork(server, worker):
+    """fork 后丢弃继承来的连接池（不关闭父进程的连接），各 worker 重新建连"""
+    from database import engine
+    engine.dispose(close=False)
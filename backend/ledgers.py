@@ -0,0 +1,266 @@
+"""
+多账本
+
+默认账本就是 DATABASE_URL（data/bookkeeping.db），沿用全局的 engine / 分析引擎 / 变更推送；
+其他账本各自一个 SQLite 文件 LEDGER_DIR/<id>.db，写入不再争同一把文件锁。
+
+接口：/api/... 为默认账本，/api/ledgers/{ledger_id}/... 为指定账本（同一组路由）。
+每个进程用 LRU 缓存已打开的账本（engine + 会话工厂 + 分析引擎 + 变更推送），
+超过 LEDGER_CACHE_SIZE 个或空闲 LEDGER_IDLE_SECONDS 秒后关闭；
+账本在本进程第一次被访问时才建表、迁移、修复数据并加载分析引擎。
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import DATA_DIR, IS_SQLITE, engine, SessionLocal, make_engine, init_db
+from models import Receipt, LedgerChange
+import analytics
+import budgets
+import merchants
+from events import ChangeFeed, feed, prune_changes
+
+DEFAULT = "default"
+LEDGER_DIR = os.getenv("LEDGER_DIR", os.path.join(DATA_DIR, "ledgers"))
+LEDGER_CACHE_SIZE = int(os.getenv("LEDGER_CACHE_SIZE", 16))       # 每个 worker 同时打开的账本上限
+LEDGER_IDLE_SECONDS = int(os.getenv("LEDGER_IDLE_SECONDS", 600))  # 空闲多久后关闭
+
+_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+
+class LedgerNotFound(Exception):
+    """账本不存在"""
+
+
+class Ledger:
+    """一个已打开的账本"""
+
+    def __init__(self, ledger_id: str, engine, session_factory, store: analytics.ColumnStore, feed: ChangeFeed):
+        self.id = ledger_id
+        self.engine = engine
+        self.session_factory = session_factory
+        self.store = store
+        self.feed = feed
+        self.prepared = False
+        self.last_used = time.monotonic()
+        self._prepare_lock = threading.Lock()
+
+    def session(self) -> Session:
+        return self.session_factory()
+
+    def ensure_prepared(self):
+        if self.prepared:
+            return
+        with self._prepare_lock:
+            if not self.prepared:
+                prepare(self)
+
+    def close(self):
+        self.feed.close()
+        self.engine.dispose()
+
+
+def validate_id(ledger_id: str) -> str:
+    if not _ID_PATTERN.match(ledger_id or ""):
+        raise ValueError("账本 id 只能包含小写字母、数字、- 和 _，最长 32 位")
+    return ledger_id
+
+
+def database_path(ledger_id: str) -> str:
+    """非默认账本的数据库文件"""
+    return os.path.join(LEDGER_DIR, f"{validate_id(ledger_id)}.db")
+
+
+def exists(ledger_id: str) -> bool:
+    return ledger_id == DEFAULT or os.path.isfile(database_path(ledger_id))
+
+
+def list_ids() -> list[str]:
+    ids = [DEFAULT]
+    if os.path.isdir(LEDGER_DIR):
+        ids += sorted(
+            name[:-3] for name in os.listdir(LEDGER_DIR)
+            if name.endswith(".db") and _ID_PATTERN.match(name[:-3])
+        )
+    return ids
+
+
+def _mark_edited_from_changes(db: Session):
+    """
+    升级前的手动编辑没有 edited_at：按变更日志中仍保留的 'updated' 记录补上
+
+    日志只保留最近 KEEP_CHANGES 条且始于变更日志上线，更早的编辑无从得知。
+    """
+    edited = (
+        db.query(LedgerChange.receipt_id, func.max(LedgerChange.created_at))
+        .filter(LedgerChange.op == "updated")
+        .group_by(LedgerChange.receipt_id)
+        .all()
+    )
+    if not edited:
+        return
+    pending = {
+        rid for (rid,) in
+        db.query(Receipt.id).filter(Receipt.id.in_([rid for rid, _ in edited]), Receipt.edited_at.is_(None))
+    }
+    for rid, edited_at in edited:
+        if rid in pending:
+            db.query(Receipt).filter(Receipt.id == rid).update({"edited_at": edited_at or datetime.now()})
+    if pending:
+        db.commit()
+
+
+def prepare(ledger: Ledger, mark: Callable[[str], None] = lambda label: None):
+    """账本首次打开：建表 / 补列、修复历史数据、回填预算累计与商户、加载分析引擎"""
+    init_db(ledger.engine)
+    mark("init_db")
+
+    # 自动修复历史脏数据（如把 " 2026-02-22 " 修正为 "2026-02-22"）
+    try:
+        db = ledger.session()
+        # 只取需要检查的列，避免每次启动把全表实例化成 ORM 对象
+        rows = db.query(Receipt.id, Receipt.date, Receipt.merchant, Receipt.type).all()
+        fixes: dict[int, dict] = {}
+        for rid, r_date, r_merchant, r_type in rows:
+            if not r_date:
+                continue
+
+            # 修复商户名为空的情况
+            if not r_merchant or str(r_merchant).strip() in ["", "None", "未知", "null"]:
+                fixes.setdefault(rid, {}).update(
+                    merchant="转账/入账" if r_type == "income" else "未知商户",
+                    merchant_id=None,   # 由下面的 backfill 重新归入商户
+                )
+
+            clean_date = r_date.strip()
+
+            # 如果清理空格后依然不符合 YYYY-MM-DD，尝试补零
+            if len(clean_date) < 10 or clean_date != r_date:
+                try:
+                    dt = datetime.strptime(clean_date, "%Y-%m-%d")
+                    padded = dt.strftime("%Y-%m-%d")
+                    if padded != r_date:
+                        fixes.setdefault(rid, {})["date"] = padded
+                except Exception:
+                    pass
+        changed = bool(fixes)
+        for rid, values in fixes.items():
+            db.query(Receipt).filter(Receipt.id == rid).update(values)
+        if changed:
+            db.commit()
+        _mark_edited_from_changes(db)
+        # 预算累计表：首次启用时回填，修复过日期则重建
+        budgets.ensure_rollup(db, force=changed)
+        # 商户维度：为升级前的历史账单 / 修复过商户名的账单补上 merchant_id
+        merchants.backfill(db)
+        db.close()
+        # 变更日志：上次打开以来的写入可能已超出保留条数
+        prune_changes(ledger.session_factory)
+    except Exception as e:
+        print(f"Data migration failed ({ledger.id}): {e}")
+    mark("data repair")
+
+    # 分析引擎整表加载；默认账本在 preload 时加载，worker 直接继承这份数组
+    db = ledger.session()
+    try:
+        ledger.store.load(db)
+    finally:
+        db.close()
+    mark("analytics preload")
+    ledger.prepared = True
+
+
+class LedgerCache:
+    """进程内已打开账本的 LRU 缓存；默认账本常驻，不参与逐出"""
+
+    def __init__(self):
+        self.default = Ledger(DEFAULT, engine, SessionLocal, analytics.store, feed)
+        self._ledgers: "OrderedDict[str, Ledger]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ledger_id: str = DEFAULT, create: bool = False) -> Ledger:
+        """
+        取得已准备好的账本（必要时打开并初始化）
+
+        Raises:
+            ValueError: id 不合法，或当前数据库不是 SQLite 却要打开其他账本
+            LedgerNotFound: 账本不存在且 create=False
+        """
+        if ledger_id == DEFAULT:
+            ledger = self.default
+        else:
+            ledger = self._open(ledger_id, create)
+        ledger.last_used = time.monotonic()
+        ledger.ensure_prepared()
+        return ledger
+
+    def _open(self, ledger_id: str, create: bool) -> Ledger:
+        validate_id(ledger_id)
+        with self._lock:
+            ledger = self._ledgers.get(ledger_id)
+            if ledger is not None:
+                self._ledgers.move_to_end(ledger_id)
+                return ledger
+
+            if not IS_SQLITE:
+                raise ValueError("多账本模式仅支持 SQLite（每个账本一个数据库文件）")
+            path = database_path(ledger_id)
+            if not create and not os.path.isfile(path):
+                raise LedgerNotFound(ledger_id)
+            os.makedirs(LEDGER_DIR, exist_ok=True)
+
+            ledger_engine = make_engine(f"sqlite:///{path}")
+            factory = sessionmaker(autocommit=False, autoflush=False, bind=ledger_engine)
+            store = analytics.ColumnStore()
+            ledger = Ledger(ledger_id, ledger_engine, factory, store, ChangeFeed(factory, store))
+            self._ledgers[ledger_id] = ledger
+            self._evict(keep=ledger_id)
+            return ledger
+
+    def _evict(self, keep: Optional[str] = None):
+        """逐出超出容量的最久未用账本与空闲超时的账本（有 SSE 订阅者的保留）；调用方持有 _lock"""
+        now = time.monotonic()
+        over = len(self._ledgers) - LEDGER_CACHE_SIZE
+        for ledger_id, ledger in list(self._ledgers.items()):
+            if ledger_id == keep or ledger.feed.subscriber_count:
+                continue
+            if over > 0 or now - ledger.last_used > LEDGER_IDLE_SECONDS:
+                del self._ledgers[ledger_id]
+                ledger.close()
+                over -= 1
+
+    def sweep(self):
+        """定期调用（线程池中）：关闭空闲账本，清理仍打开账本的变更日志
+
+        非默认账本的 ChangeFeed 没有订阅者时不运行，不能依赖它清理。
+        """
+        with self._lock:
+            self._evict()
+            opened = list(self._ledgers.values())
+        for ledger in opened:
+            try:
+                prune_changes(ledger.session_factory)
+            except Exception as e:
+                print(f"Prune ledger changes failed ({ledger.id}): {e}")
+
+    def opened(self) -> list[str]:
+        with self._lock:
+            return [DEFAULT, *self._ledgers]
+
+    def close_all(self):
+        with self._lock:
+            for ledger in self._ledgers.values():
+                ledger.close()
+            self._ledgers.clear()
+
+
+# 进程内单例（每个 gunicorn worker 各一份）
+cache = LedgerCache()
+
@@ -1,97 +1,128 @@
 """
 个人记账系统 — FastAPI 后端主入口
+
+create_app() 为应用工厂；模块级的 app 供 `uvicorn main:app` / `gunicorn main:app` 使用。
+配合 gunicorn --preload（见 gunicorn.conf.py），导入、建表、数据修复与分析引擎加载
+只在 master 中做一次，worker fork 后以写时复制方式共享。
 """
+import boot  # 最先导入：启动计时从这里开始
+
 import os
+import asyncio
+import csv
+import io
 import hashlib
 import base64
-from datetime import date, datetime
+import traceback
+from datetime import date, datetime, timedelta
 from typing import Optional
 from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 load_dotenv()  # 加载 .env 文件（必须在其他模块导入前）
+boot.mark("import stdlib + dotenv")
 
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import func, extract
+from sqlalchemy.exc import IntegrityError
+boot.mark("import fastapi + sqlalchemy")
 
-from database import get_db, init_db
-from models import Receipt
+from database import month_of
+from models import Receipt, Setting, Budget
 from schemas import (
     UploadReceiptRequest, UploadReceiptResponse, ReceiptData,
-    UpdateReceiptRequest, ManualReceiptRequest,
-    MonthStatsResponse, CategoryStat, DailyStat,
-    YearlyResponse, MonthlySummary,
+    UpdateReceiptRequest, ManualReceiptRequest, normalize_date,
+    MonthStatsResponse,
+    YearlyResponse,
     ReceiptListResponse,
     NetWorthResponse,
     UpdateNetWorthRequest,
+    RangeStatsResponse, RollingResponse, CompareResponse, ProfileResponse,
+    DashboardResponse,
+    BudgetListResponse, UpdateBudgetRequest,
+    BackupListResponse, BackupResult,
+    TopMerchantsResponse, MerchantListResponse, MergeMerchantRequest,
+    RequestProfileListResponse,
+    LedgerItem, LedgerListResponse, CreateLedgerRequest,
 )
 from ai_service import recognize_receipt
+import analytics
+from responses import FastResponse, RECEIPT_COLUMNS, RECEIPT_FIELDS, receipt_rows
+from events import record_change
+import singleflight
+import budgets
+import merchants
+import profiling
+import ledgers
+import backup
+boot.mark("import app modules")
+
+
+def prepare():
+    """一次性启动工作：默认账本建表、修复历史数据、加载分析引擎。--preload 时在 master 中执行"""
+    if boot.prepared:
+        return
+    ledgers.prepare(ledgers.cache.default, mark=boot.mark)
+    boot.prepared = True
+
+
+async def _sweep_ledgers():
+    """定期关闭空闲的非默认账本"""
+    while True:
+        await asyncio.sleep(60)
+        await asyncio.to_thread(ledgers.cache.sweep)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """应用生命周期：启动时初始化数据库"""
-    init_db()
-    
-    # 自动修复历史脏数据（如把 " 2026-02-22 " 修正为 "2026-02-22"）
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        receipts = db.query(Receipt).all()
-        changed = False
-        for r in receipts:
-            if not r.date:
-                continue
-            
-            # 修复商户名为空的情况
-            if not r.merchant or str(r.merchant).strip() in ["", "None", "未知", "null"]:
-                r.merchant = "转账/入账" if r.type == "income" else "未知商户"
-                changed = True
-
-            clean_date = r.date.strip()
-            
-            # 如果清理空格后依然不符合 YYYY-MM-DD，尝试补零
-            if len(clean_date) < 10 or clean_date != r.date:
-                try:
-                    dt = datetime.strptime(clean_date, "%Y-%m-%d")
-                    padded = dt.strftime("%Y-%m-%d")
-                    if padded != r.date:
-                        r.date = padded
-                        changed = True
-                except Exception:
-                    pass
-        if changed:
-            db.commit()
-        db.close()
-    except Exception as e:
-        print(f"Data migration failed: {e}")
-
+    """应用生命周期：未 preload 时在 worker 内完成启动工作，并启动变更推送"""
+    prepare()
+    default_feed = ledgers.cache.default.feed
+    await default_feed.start()
+    sweeper = asyncio.create_task(_sweep_ledgers())
     yield
+    sweeper.cancel()
+    await default_feed.stop()
+    ledgers.cache.close_all()
 
 
-app = FastAPI(
-    title="个人记账系统 API",
-    description="接收支付截图，AI 识别后入库，并提供统计查询接口",
-    version="1.0.0",
-    lifespan=lifespan,
-)
+# router 为账本内接口，create_app 中挂载两次：/api/...（默认账本）与 /api/ledgers/{ledger_id}/...
+# system_router 为与账本无关的接口（健康检查、启动耗时、剖析、账本管理）
+router = APIRouter(route_class=profiling.route_class())
+system_router = APIRouter(route_class=profiling.route_class())
 
-# CORS 配置 — 允许前端跨域访问
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 生产环境请改为具体域名
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+def get_ledger(ledger_id: str = ledgers.DEFAULT) -> ledgers.Ledger:
+    """当前请求的账本：/api/ledgers/{ledger_id}/... 路径参数；/api/... 下也可用 ?ledger_id= 指定"""
+    try:
+        return ledgers.cache.get(ledger_id)
+    except ledgers.LedgerNotFound:
+        raise HTTPException(status_code=404, detail=f"账本不存在: {ledger_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def get_db(ledger: ledgers.Ledger = Depends(get_ledger)):
+    """当前账本的数据库会话"""
+    db = ledger.session()
+    try:
+        yield db
+    finally:
+        db.close()
 
 
 # ==================== 上传接口 ====================
 
-@app.post("/api/upload_receipt", response_model=UploadReceiptResponse)
-async def upload_receipt(req: UploadReceiptRequest, db: Session = Depends(get_db)):
+@router.post("/upload_receipt", response_model=UploadReceiptResponse)
+async def upload_receipt(
+    req: UploadReceiptRequest,
+    db: Session = Depends(get_db),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
     """
     接收支付截图 Base64，调用 AI 识别并入库
     """
@@ -107,35 +138,38 @@ async def upload_receipt(req: UploadReceiptRequest, db: Session = Depends(get_db
 
         image_hash = hashlib.md5(image_bytes).hexdigest()
 
-        # 2. 检查是否重复提交
-        existing = db.query(Receipt).filter(Receipt.image_hash == image_hash).first()
-        if existing:
-            return UploadReceiptResponse(
-                success=True,
-                message=f"⚠️ 该账单已存在：{existing.merchant} - {existing.amount}元",
-                data=ReceiptData(**existing.to_dict()),
-            )
-
-        # 3. 调用 AI 识别
-        parsed = await recognize_receipt(req.image_base64)
-
-        # 4. 入库
-        receipt = Receipt(
-            date=parsed["date"],
-            merchant=parsed["merchant"],
-            amount=parsed["amount"],
-            type=parsed["type"],
-            category=parsed["category"],
-            raw_response=parsed.get("raw_response"),
-            image_hash=image_hash,
-        )
-        db.add(receipt)
-        db.commit()
-        db.refresh(receipt)
+        # 2. 检查是否重复提交（数据库读写都在线程池执行，不阻塞事件循环上的其他请求与 SSE）
+        duplicate = await asyncio.to_thread(_find_duplicate, db, image_hash)
+        if duplicate:
+            return duplicate
 
-        # 5. 构建友好消息
+        # 3. 争抢识别权：同一截图并发上传（快捷指令重试 / 多设备）只有一个请求调用 AI
+        if not await singleflight.acquire(image_hash, ledger.session_factory):
+            return await asyncio.to_thread(_find_duplicate, db, image_hash)
+
+        try:
+            # 4. 调用 AI 识别
+            with profiling.span("model"):
+                parsed = await recognize_receipt(req.image_base64)
+
+            # 5. 入库（同一事务内释放占位）
+            stored = await asyncio.to_thread(_store_receipt, db, parsed, image_hash)
+        except BaseException:
+            await singleflight.release(image_hash, failed=True, session_factory=ledger.session_factory)
+            raise
+        if stored is None:
+            # 占位过期被接管等极端情况下，另一请求已先入库
+            await singleflight.release(image_hash, failed=True, session_factory=ledger.session_factory)
+            return await asyncio.to_thread(_find_duplicate, db, image_hash)
+        receipt, alerts = stored
+        await singleflight.release(image_hash, session_factory=ledger.session_factory)
+        ledger.store.apply(receipt)
+        ledger.feed.notify()
+
+        # 6. 构建友好消息
         type_emoji = "💰" if receipt.type == "income" else "💸"
         message = f"✅ 记账成功：{receipt.merchant} - {type_emoji}{receipt.amount}元"
+        message = "\n".join([message, *alerts])
 
         return UploadReceiptResponse(
             success=True,
@@ -143,31 +177,86 @@ async def upload_receipt(req: UploadReceiptRequest, db: Session = Depends(get_db
             data=ReceiptData(**receipt.to_dict()),
         )
 
+    except HTTPException:
+        raise
+    except singleflight.UploadInProgress:
+        raise HTTPException(status_code=409, detail="该截图正在识别中，请稍后重试")
     except ValueError as e:
-        import traceback
         traceback.print_exc()
         raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
-        import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
 
 
+def _find_duplicate(db: Session, image_hash: str) -> Optional[UploadReceiptResponse]:
+    """按图片哈希查找已入库账单（线程池中执行）
+
+    查完即结束查询自动开启的事务：调用方随后最长要等单飞（90s）和 AI 识别（60s），
+    不能让池里的连接一直处于 idle in transaction。
+    """
+    try:
+        existing = db.query(Receipt).filter(Receipt.image_hash == image_hash).first()
+        return _duplicate_response(existing) if existing else None
+    finally:
+        db.rollback()
+
+
+def _store_receipt(db: Session, parsed: dict, image_hash: str) -> Optional[tuple[Receipt, list[str]]]:
+    """识别结果入库并在同一事务内释放占位（线程池中执行），返回 (账单, 预算提醒)；
+    同一截图已被其他请求先入库时返回 None"""
+    receipt = Receipt(
+        date=parsed["date"],
+        merchant=parsed["merchant"],
+        amount=parsed["amount"],
+        type=parsed["type"],
+        category=parsed["category"],
+        raw_response=parsed.get("raw_response"),
+        image_hash=image_hash,
+    )
+    try:
+        merchants.assign(db, receipt)
+        db.add(receipt)
+        db.flush()
+        record_change(db, "created", receipt)
+        alerts = budgets.apply_change(db, None, receipt)
+        singleflight.release_in(db, image_hash)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    except BaseException:
+        db.rollback()
+        raise
+    db.refresh(receipt)
+    # 结束 refresh 开启的事务再交回事件循环（先移出会话，回滚不会使已加载的字段过期）
+    db.expunge(receipt)
+    db.rollback()
+    return receipt, alerts
+
+
+def _duplicate_response(existing: Receipt) -> UploadReceiptResponse:
+    """重复提交同一截图：幂等返回已入库的记录"""
+    return UploadReceiptResponse(
+        success=True,
+        message=f"⚠️ 该账单已存在：{existing.merchant} - {existing.amount}元",
+        data=ReceiptData(**existing.to_dict()),
+    )
+
+
 # ==================== 资产与统计接口 ====================
 
-@app.get("/api/net_worth", response_model=NetWorthResponse)
-def get_net_worth(db: Session = Depends(get_db)):
+@router.get("/net_worth", response_model=NetWorthResponse)
+def get_net_worth(db: Session = Depends(get_db), ledger: ledgers.Ledger = Depends(get_ledger)):
     """获取当前总净资产。总资产 = 初始基数(如有) + 历史总收入 - 历史总支出"""
     
     # 获取设置的 base_worth，如果没有则默认为 0
-    from models import Setting
     setting = db.query(Setting).filter(Setting.key == "net_worth_base").first()
     base_worth = float(setting.value) if setting else 0.0
 
-    # 计算历史所有的收支总和
-    receipts = db.query(Receipt).all()
-    total_income = sum(r.amount for r in receipts if r.type == "income")
-    total_expense = sum(r.amount for r in receipts if r.type == "expense")
+    # 计算历史所有的收支总和（内存列存储归约，与首页一致）
+    ledger.store.ensure_fresh(db)
+    total_income, total_expense = analytics.lifetime_totals(ledger.store)
     
     net_worth = base_worth + total_income - total_expense
 
@@ -179,21 +268,23 @@ def get_net_worth(db: Session = Depends(get_db)):
     )
 
 
-@app.put("/api/net_worth", response_model=NetWorthResponse)
-def update_net_worth(req: UpdateNetWorthRequest, db: Session = Depends(get_db)):
+@router.put("/net_worth", response_model=NetWorthResponse)
+def update_net_worth(
+    req: UpdateNetWorthRequest,
+    db: Session = Depends(get_db),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
     """手动校准当前总资产。会反向计算并更新 base_worth"""
     target_net_worth = req.current_net_worth
     
     # 计算当前历史流水差额
-    receipts = db.query(Receipt).all()
-    total_income = sum(r.amount for r in receipts if r.type == "income")
-    total_expense = sum(r.amount for r in receipts if r.type == "expense")
+    ledger.store.ensure_fresh(db)
+    total_income, total_expense = analytics.lifetime_totals(ledger.store)
     history_diff = total_income - total_expense
     
     # 新的 base_worth = 目标总资产 - 历史流水差额
     new_base = target_net_worth - history_diff
 
-    from models import Setting
     setting = db.query(Setting).filter(Setting.key == "net_worth_base").first()
     if not setting:
         setting = Setting(key="net_worth_base", value=str(new_base))
@@ -211,7 +302,7 @@ def update_net_worth(req: UpdateNetWorthRequest, db: Session = Depends(get_db)):
     )
 
 
-@app.get("/api/get_stats", response_model=MonthStatsResponse)
+@router.get("/get_stats", response_model=MonthStatsResponse)
 def get_stats(
     year: int = Query(default=None, description="年份"),
     month: int = Query(default=None, ge=1, le=12, description="月份"),
@@ -226,48 +317,50 @@ def get_stats(
     if month is None:
         month = today.month
 
-    # 构建日期范围 YYYY-MM-01 到 YYYY-MM-31
-    month_prefix = f"{year:04d}-{month:02d}"
-
-    records = db.query(Receipt).filter(Receipt.date.like(f"{month_prefix}%")).all()
-
-    total_expense = sum(r.amount for r in records if r.type == "expense")
-    total_income = sum(r.amount for r in records if r.type == "income")
-
-    # 分类统计（仅支出）
-    category_map: dict[str, float] = {}
-    for r in records:
-        if r.type == "expense":
-            category_map[r.category] = category_map.get(r.category, 0) + r.amount
-
-    by_category = []
-    for cat, amt in sorted(category_map.items(), key=lambda x: -x[1]):
-        pct = round(amt / total_expense * 100, 1) if total_expense > 0 else 0
-        by_category.append(CategoryStat(category=cat, amount=round(amt, 2), percentage=pct))
-
-    # 每日支出
-    daily_map: dict[str, float] = {}
-    for r in records:
-        if r.type == "expense":
-            daily_map[r.date] = daily_map.get(r.date, 0) + r.amount
+    # 日期范围 [本月 1 日, 下月 1 日)，按 (日, 收支, 分类) 在数据库内聚合
+    start = date(year, month, 1)
+    next_start = date(year + month // 12, month % 12 + 1, 1)
+    records = (
+        db.query(Receipt.date, func.sum(Receipt.amount), Receipt.type, Receipt.category)
+        .filter(Receipt.date >= start.isoformat(), Receipt.date < next_start.isoformat())
+        .group_by(Receipt.date, Receipt.type, Receipt.category)
+        .all()
+    )
 
-    daily_expense = [
-        DailyStat(date=d, amount=round(a, 2))
-        for d, a in sorted(daily_map.items())
+    total_expense = 0.0
+    total_income = 0.0
+    category_map: dict[str, float] = {}   # 分类统计（仅支出）
+    daily_map: dict[str, float] = {}      # 每日支出
+    for r_date, amount, r_type, category in records:
+        if r_type == "expense":
+            total_expense += amount
+            category_map[category] = category_map.get(category, 0) + amount
+            daily_map[r_date] = daily_map.get(r_date, 0) + amount
+        elif r_type == "income":
+            total_income += amount
+
+    by_category = [
+        {
+            "category": cat,
+            "amount": round(amt, 2),
+            "percentage": round(amt / total_expense * 100, 1) if total_expense > 0 else 0,
+        }
+        for cat, amt in sorted(category_map.items(), key=lambda x: -x[1])
     ]
+    daily_expense = [{"date": d, "amount": round(a, 2)} for d, a in sorted(daily_map.items())]
 
-    return MonthStatsResponse(
-        total_expense=round(total_expense, 2),
-        total_income=round(total_income, 2),
-        balance=round(total_income - total_expense, 2),
-        by_category=by_category,
-        daily_expense=daily_expense,
-    )
+    return FastResponse({
+        "total_expense": round(total_expense, 2),
+        "total_income": round(total_income, 2),
+        "balance": round(total_income - total_expense, 2),
+        "by_category": by_category,
+        "daily_expense": daily_expense,
+    })
 
 
 # ==================== 年度接口 ====================
 
-@app.get("/api/get_yearly", response_model=YearlyResponse)
+@router.get("/get_yearly", response_model=YearlyResponse)
 def get_yearly(
     year: int = Query(default=None, description="年份"),
     db: Session = Depends(get_db),
@@ -278,52 +371,165 @@ def get_yearly(
     if year is None:
         year = date.today().year
 
-    year_prefix = f"{year:04d}"
-    records = db.query(Receipt).filter(Receipt.date.like(f"{year_prefix}%")).all()
+    month_key = month_of(Receipt.date)
+    records = (
+        db.query(month_key, Receipt.type, func.sum(Receipt.amount))
+        .filter(Receipt.date >= f"{year:04d}-01-01", Receipt.date <= f"{year:04d}-12-31")
+        .group_by(month_key, Receipt.type)
+        .all()
+    )
 
     # 按月汇总
     monthly_data: dict[int, dict] = {}
     for m in range(1, 13):
         monthly_data[m] = {"income": 0.0, "expense": 0.0}
 
-    for r in records:
+    for r_month, r_type, amount in records:
         try:
-            m = int(r.date[5:7])
-            monthly_data[m][r.type] += r.amount
+            m = int(r_month[5:7])
+            monthly_data[m][r_type] += amount
         except (ValueError, KeyError):
             pass
 
     monthly = [
-        MonthlySummary(
-            month=m,
-            income=round(d["income"], 2),
-            expense=round(d["expense"], 2),
-            balance=round(d["income"] - d["expense"], 2),
-        )
+        {
+            "month": m,
+            "income": round(d["income"], 2),
+            "expense": round(d["expense"], 2),
+            "balance": round(d["income"] - d["expense"], 2),
+        }
         for m, d in sorted(monthly_data.items())
     ]
 
-    return YearlyResponse(year=year, monthly=monthly)
+    return FastResponse({"year": year, "monthly": monthly})
 
 
-# ==================== 明细接口 ====================
+# ==================== 首页聚合接口 ====================
 
-@app.get("/api/receipts", response_model=ReceiptListResponse)
-def get_receipts(
-    page: int = Query(default=1, ge=1, description="页码"),
-    page_size: int = Query(default=20, ge=1, le=100, description="每页条数"),
-    start_date: Optional[str] = Query(default=None, description="起始日期 YYYY-MM-DD"),
-    end_date: Optional[str] = Query(default=None, description="结束日期 YYYY-MM-DD"),
-    category: Optional[str] = Query(default=None, description="分类筛选"),
-    type: Optional[str] = Query(default=None, description="income / expense"),
-    merchant: Optional[str] = Query(default=None, description="商家名称搜索"),
+@router.get("/dashboard", response_model=DashboardResponse)
+def get_dashboard(
+    year: int = Query(default=None, description="年份"),
+    month: int = Query(default=None, ge=1, le=12, description="月份"),
+    recent: int = Query(default=10, ge=1, le=50, description="最近账单条数"),
     db: Session = Depends(get_db),
+    ledger: ledgers.Ledger = Depends(get_ledger),
 ):
     """
-    分页查询账单明细，支持多维度筛选
+    PWA 首屏一次取齐：月度统计、净资产、最近账单、年度汇总。
+    统计部分都由内存列存储归约得出，数据库只读最近 N 条账单与净资产基数。
     """
-    query = db.query(Receipt)
+    today = date.today()
+    if year is None:
+        year = today.year
+    if month is None:
+        month = today.month
 
+    ledger.store.ensure_fresh(db)
+    setting = db.query(Setting).filter(Setting.key == "net_worth_base").first()
+    base_worth = float(setting.value) if setting else 0.0
+    items = (
+        db.query(*RECEIPT_COLUMNS)
+        .order_by(Receipt.date.desc(), Receipt.id.desc())
+        .limit(recent)
+        .all()
+    )
+
+    total_income, total_expense = analytics.lifetime_totals(ledger.store)
+    return FastResponse({
+        "month_stats": analytics.month_stats(year, month, ledger.store),
+        "net_worth": {
+            "net_worth": round(base_worth + total_income - total_expense, 2),
+            "base_worth": round(base_worth, 2),
+            "total_income": round(total_income, 2),
+            "total_expense": round(total_expense, 2),
+        },
+        "recent": receipt_rows(items),
+        "yearly": analytics.yearly(year, ledger.store),
+    })
+
+
+# ==================== 区间分析接口 ====================
+
+def _parse_range(start_date: Optional[str], end_date: Optional[str], default_days: int = 30) -> tuple[date, date]:
+    """解析 YYYY-MM-DD 区间，缺省为截至今天的最近 default_days 天"""
+    try:
+        end = date.fromisoformat(end_date) if end_date else date.today()
+        start = date.fromisoformat(start_date) if start_date else end - timedelta(days=default_days - 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式应为 YYYY-MM-DD")
+    if start > end:
+        raise HTTPException(status_code=400, detail="起始日期不能晚于结束日期")
+    return start, end
+
+
+@router.get("/analytics/range", response_model=RangeStatsResponse)
+def analytics_range(
+    start_date: Optional[str] = Query(default=None, description="起始日期 YYYY-MM-DD，默认最近 30 天"),
+    end_date: Optional[str] = Query(default=None, description="结束日期 YYYY-MM-DD，默认今天"),
+    db: Session = Depends(get_db),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
+    """任意日期区间的收支合计与支出分类占比"""
+    start, end = _parse_range(start_date, end_date)
+    ledger.store.ensure_fresh(db)
+    return FastResponse(analytics.range_stats(start, end, ledger.store))
+
+
+@router.get("/analytics/rolling", response_model=RollingResponse)
+def analytics_rolling(
+    window: int = Query(default=7, ge=1, le=366, description="滚动窗口天数，如 7 / 30"),
+    start_date: Optional[str] = Query(default=None, description="起始日期 YYYY-MM-DD，默认最近 30 天"),
+    end_date: Optional[str] = Query(default=None, description="结束日期 YYYY-MM-DD，默认今天"),
+    type: str = Query(default="expense", pattern="^(income|expense)$", description="income / expense"),
+    db: Session = Depends(get_db),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
+    """区间内每天的滚动 N 天合计"""
+    start, end = _parse_range(start_date, end_date)
+    ledger.store.ensure_fresh(db)
+    return FastResponse(analytics.rolling(start, end, window, type, ledger.store))
+
+
+@router.get("/analytics/compare", response_model=CompareResponse)
+def analytics_compare(
+    mode: str = Query(default="mom", pattern="^(yoy|mom|prev)$", description="yoy 同比 / mom 环比 / prev 上一等长区间"),
+    start_date: Optional[str] = Query(default=None, description="起始日期 YYYY-MM-DD，默认本月 1 日"),
+    end_date: Optional[str] = Query(default=None, description="结束日期 YYYY-MM-DD，默认今天"),
+    type: str = Query(default="expense", pattern="^(income|expense)$", description="income / expense"),
+    db: Session = Depends(get_db),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
+    """按分类的同比 / 环比对比"""
+    if start_date is None and end_date is None:
+        start_date = date.today().replace(day=1).isoformat()
+    start, end = _parse_range(start_date, end_date)
+    ledger.store.ensure_fresh(db)
+    return FastResponse(analytics.compare(start, end, mode, type, ledger.store))
+
+
+@router.get("/analytics/profile", response_model=ProfileResponse)
+def analytics_profile(
+    start_date: Optional[str] = Query(default=None, description="起始日期 YYYY-MM-DD，默认最近 90 天"),
+    end_date: Optional[str] = Query(default=None, description="结束日期 YYYY-MM-DD，默认今天"),
+    type: str = Query(default="expense", pattern="^(income|expense)$", description="income / expense"),
+    db: Session = Depends(get_db),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
+    """星期几（按交易日期）与小时（按入库时间）的消费画像"""
+    start, end = _parse_range(start_date, end_date, default_days=90)
+    ledger.store.ensure_fresh(db)
+    return FastResponse(analytics.profile(start, end, type, ledger.store))
+
+
+# ==================== 明细接口 ====================
+
+def _filter_receipts(query, start_date, end_date, category, type, merchant):
+    """明细与导出共用的筛选条件（日期不合法时 400，不交给数据库比较）"""
+    try:
+        start_date = normalize_date(start_date) if start_date else None
+        end_date = normalize_date(end_date) if end_date else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if start_date:
         query = query.filter(Receipt.date >= start_date)
     if end_date:
@@ -334,8 +540,29 @@ def get_receipts(
         query = query.filter(Receipt.type == type)
     if merchant:
         query = query.filter(Receipt.merchant.contains(merchant))
+    return query
+
+
+@router.get("/receipts", response_model=ReceiptListResponse)
+def get_receipts(
+    page: int = Query(default=1, ge=1, description="页码"),
+    page_size: int = Query(default=20, ge=1, le=100, description="每页条数"),
+    start_date: Optional[str] = Query(default=None, description="起始日期 YYYY-MM-DD"),
+    end_date: Optional[str] = Query(default=None, description="结束日期 YYYY-MM-DD"),
+    category: Optional[str] = Query(default=None, description="分类筛选"),
+    type: Optional[str] = Query(default=None, description="income / expense"),
+    merchant: Optional[str] = Query(default=None, description="商家名称搜索"),
+    db: Session = Depends(get_db),
+):
+    """
+    分页查询账单明细，支持多维度筛选
+    """
+    query = _filter_receipts(db.query(*RECEIPT_COLUMNS), start_date, end_date, category, type, merchant)
 
-    total = query.count()
+    # count(*) 可走最小索引，比 count(id) 扫表快；先 select_from 再加筛选，无筛选条件时也有 FROM
+    total = _filter_receipts(
+        db.query(func.count()).select_from(Receipt), start_date, end_date, category, type, merchant,
+    ).scalar()
     items = (
         query.order_by(Receipt.date.desc(), Receipt.id.desc())
         .offset((page - 1) * page_size)
@@ -343,51 +570,116 @@ def get_receipts(
         .all()
     )
 
-    return ReceiptListResponse(
-        total=total,
-        page=page,
-        page_size=page_size,
-        items=[ReceiptData(**r.to_dict()) for r in items],
+    return FastResponse({
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "items": receipt_rows(items),
+    })
+
+
+@router.get("/receipts/export")
+def export_receipts(
+    format: str = Query(default="csv", pattern="^(csv|json)$", description="csv / json"),
+    start_date: Optional[str] = Query(default=None, description="起始日期 YYYY-MM-DD"),
+    end_date: Optional[str] = Query(default=None, description="结束日期 YYYY-MM-DD"),
+    category: Optional[str] = Query(default=None, description="分类筛选"),
+    type: Optional[str] = Query(default=None, description="income / expense"),
+    merchant: Optional[str] = Query(default=None, description="商家名称搜索"),
+    db: Session = Depends(get_db),
+):
+    """
+    导出账单明细（筛选条件同 /api/receipts，不分页）
+    """
+    query = _filter_receipts(db.query(*RECEIPT_COLUMNS), start_date, end_date, category, type, merchant)
+    query = query.order_by(Receipt.date.desc(), Receipt.id.desc())
+
+    if format == "json":
+        return FastResponse(receipt_rows(query.all()))
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        buf.write("\ufeff")  # BOM，Excel 打开中文不乱码
+        writer.writerow(RECEIPT_FIELDS)
+        for i, row in enumerate(query.yield_per(1000), 1):
+            writer.writerow(row)
+            if i % 1000 == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": "attachment; filename=receipts.csv"},
     )
 
 
 # ==================== 编辑/删除/手动添加 ====================
 
-@app.put("/api/receipts/{receipt_id}", response_model=UploadReceiptResponse)
-def update_receipt(receipt_id: int, req: UpdateReceiptRequest, db: Session = Depends(get_db)):
+@router.put("/receipts/{receipt_id}", response_model=UploadReceiptResponse)
+def update_receipt(
+    receipt_id: int,
+    req: UpdateReceiptRequest,
+    db: Session = Depends(get_db),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
     """编辑账单记录（修正 AI 识别错误）"""
     receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
     if not receipt:
         raise HTTPException(status_code=404, detail="记录不存在")
 
+    before = budgets.snapshot(receipt)
     update_data = req.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(receipt, key, value)
+    if "merchant" in update_data:
+        merchants.assign(db, receipt)
+    receipt.edited_at = datetime.now()
+    db.flush()
+    record_change(db, "updated", receipt)
+    alerts = budgets.apply_change(db, before, receipt)
     db.commit()
     db.refresh(receipt)
+    ledger.store.apply(receipt)
+    ledger.feed.notify()
 
     return UploadReceiptResponse(
         success=True,
-        message=f"✅ 已更新：{receipt.merchant} ¥{receipt.amount}",
+        message="\n".join([f"✅ 已更新：{receipt.merchant} ¥{receipt.amount}", *alerts]),
         data=ReceiptData(**receipt.to_dict()),
     )
 
 
-@app.delete("/api/receipts/{receipt_id}")
-def delete_receipt(receipt_id: int, db: Session = Depends(get_db)):
+@router.delete("/receipts/{receipt_id}")
+def delete_receipt(
+    receipt_id: int,
+    db: Session = Depends(get_db),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
     """删除账单记录"""
     receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
     if not receipt:
         raise HTTPException(status_code=404, detail="记录不存在")
 
     merchant = receipt.merchant
+    record_change(db, "deleted", receipt)
+    budgets.apply_change(db, budgets.snapshot(receipt), None)
     db.delete(receipt)
     db.commit()
+    ledger.store.discard(receipt_id)
+    ledger.feed.notify()
     return {"success": True, "message": f"🗑️ 已删除：{merchant}"}
 
 
-@app.post("/api/receipts/manual", response_model=UploadReceiptResponse)
-def manual_add(req: ManualReceiptRequest, db: Session = Depends(get_db)):
+@router.post("/receipts/manual", response_model=UploadReceiptResponse)
+def manual_add(
+    req: ManualReceiptRequest,
+    db: Session = Depends(get_db),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
     """手动添加账单（不走 AI）"""
     receipt = Receipt(
         date=req.date,
@@ -396,25 +688,231 @@ def manual_add(req: ManualReceiptRequest, db: Session = Depends(get_db)):
         type=req.type,
         category=req.category,
     )
+    merchants.assign(db, receipt)
     db.add(receipt)
+    db.flush()
+    record_change(db, "created", receipt)
+    alerts = budgets.apply_change(db, None, receipt)
     db.commit()
     db.refresh(receipt)
+    ledger.store.apply(receipt)
+    ledger.feed.notify()
 
     type_emoji = "💰" if receipt.type == "income" else "💸"
     return UploadReceiptResponse(
         success=True,
-        message=f"✅ 手动记账：{receipt.merchant} - {type_emoji}{receipt.amount}元",
+        message="\n".join([f"✅ 手动记账：{receipt.merchant} - {type_emoji}{receipt.amount}元", *alerts]),
         data=ReceiptData(**receipt.to_dict()),
     )
 
 
+# ==================== 商户接口 ====================
+
+@router.get("/merchants/top", response_model=TopMerchantsResponse)
+def top_merchants(
+    start_date: Optional[str] = Query(default=None, description="起始日期 YYYY-MM-DD，默认最近 30 天"),
+    end_date: Optional[str] = Query(default=None, description="结束日期 YYYY-MM-DD，默认今天"),
+    type: str = Query(default="expense", pattern="^(income|expense)$", description="income / expense"),
+    order: str = Query(default="amount", pattern="^(amount|count)$", description="amount 按金额 / count 按笔数"),
+    limit: int = Query(default=10, ge=1, le=100, description="返回前几名"),
+    db: Session = Depends(get_db),
+):
+    """区间内的商户排行：金额、笔数、笔均与占比"""
+    start, end = _parse_range(start_date, end_date)
+    return FastResponse(merchants.top(db, start, end, type, order, limit))
+
+
+@router.get("/merchants", response_model=MerchantListResponse)
+def get_merchants(
+    keyword: Optional[str] = Query(default=None, description="商户名搜索"),
+    db: Session = Depends(get_db),
+):
+    """商户列表及其别名（原始写法）"""
+    return FastResponse({"items": merchants.list_merchants(db, keyword)})
+
+
+@router.post("/merchants/merge")
+def merge_merchants(req: MergeMerchantRequest, db: Session = Depends(get_db)):
+    """把识别成两个商户的同一家店合并，之后该写法的新账单也会归入目标商户"""
+    try:
+        moved = merchants.merge(db, req.source_id, req.target_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "message": f"✅ 已合并，{moved} 条账单改归目标商户"}
+
+
+# ==================== 预算接口 ====================
+
+@router.get("/budgets", response_model=BudgetListResponse)
+def get_budgets(
+    year: int = Query(default=None, description="年份"),
+    month: int = Query(default=None, ge=1, le=12, description="月份"),
+    db: Session = Depends(get_db),
+):
+    """各分类月度预算的使用情况（读累计表，不扫账单）"""
+    today = date.today()
+    month_key = f"{year or today.year:04d}-{month or today.month:02d}"
+    return BudgetListResponse(month=month_key, items=budgets.month_status(db, month_key))
+
+
+@router.put("/budgets/{category}", response_model=BudgetListResponse)
+def set_budget(category: str, req: UpdateBudgetRequest, db: Session = Depends(get_db)):
+    """设置某分类的月度预算"""
+    budget = db.get(Budget, category)
+    if not budget:
+        db.add(Budget(category=category, amount=req.amount))
+    else:
+        budget.amount = req.amount
+    db.commit()
+    month_key = date.today().strftime("%Y-%m")
+    return BudgetListResponse(month=month_key, items=budgets.month_status(db, month_key))
+
+
+@router.delete("/budgets/{category}")
+def delete_budget(category: str, db: Session = Depends(get_db)):
+    """取消某分类的预算"""
+    budget = db.get(Budget, category)
+    if not budget:
+        raise HTTPException(status_code=404, detail="该分类未设置预算")
+    db.delete(budget)
+    db.commit()
+    return {"success": True, "message": f"🗑️ 已取消预算：{category}"}
+
+
+# ==================== 备份接口 ====================
+
+@router.get("/backups", response_model=BackupListResponse)
+def get_backups(ledger: ledgers.Ledger = Depends(get_ledger)):
+    """列出数据库快照"""
+    return BackupListResponse(items=backup.list_backups(ledger.id))
+
+
+@router.post("/backups", response_model=BackupResult)
+def create_backup(
+    compress: bool = Query(default=True, description="是否 gzip 压缩"),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
+    """立即创建一份在线快照（按页分步复制，不阻塞写入）。恢复请用 python backup.py restore"""
+    try:
+        return BackupResult(**backup.create_backup(compress=compress, ledger_id=ledger.id))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ==================== 账本管理 ====================
+
+@system_router.get("/api/ledgers", response_model=LedgerListResponse)
+def get_ledgers():
+    """所有账本；open 表示已在当前 worker 中打开"""
+    opened = set(ledgers.cache.opened())
+    return LedgerListResponse(items=[
+        LedgerItem(id=ledger_id, open=ledger_id in opened) for ledger_id in ledgers.list_ids()
+    ])
+
+
+@system_router.post("/api/ledgers", response_model=LedgerItem)
+def create_ledger(req: CreateLedgerRequest):
+    """新建账本（独立的数据库文件），之后通过 /api/ledgers/{id}/... 访问"""
+    try:
+        if ledgers.exists(req.id):
+            raise HTTPException(status_code=409, detail=f"账本已存在: {req.id}")
+        ledger = ledgers.cache.get(req.id, create=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return LedgerItem(id=ledger.id, open=True)
+
+
+# ==================== 性能剖析 ====================
+
+@system_router.get("/api/profiles", response_model=RequestProfileListResponse)
+def get_profiles(x_profile_token: Optional[str] = Header(default=None)):
+    """已保存的请求剖析（手动触发或超过慢请求阈值）"""
+    if not profiling.authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="需要 X-Profile-Token")
+    return FastResponse({"items": profiling.list_profiles()})
+
+
+@system_router.get("/api/profiles/{name}")
+def get_profile(name: str, x_profile_token: Optional[str] = Header(default=None)):
+    """单次剖析详情：SQL 语句耗时、模型等待耗时与 cProfile 函数表"""
+    if not profiling.authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="需要 X-Profile-Token")
+    data = profiling.load_profile(name)
+    if data is None:
+        raise HTTPException(status_code=404, detail="剖析记录不存在")
+    return FastResponse(data)
+
+
+# ==================== 实时推送 ====================
+
+@router.get("/events")
+async def ledger_events(
+    last_event_id: Optional[int] = Header(default=None),
+    ledger: ledgers.Ledger = Depends(get_ledger),
+):
+    """
+    SSE 账本变更流：每条消息为 {op, receipt, totals}，断线重连时按 Last-Event-ID 补发
+    """
+    return StreamingResponse(
+        ledger.feed.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 关闭 Nginx 缓冲，消息即时送达
+        },
+    )
+
+
 # ==================== 健康检查 ====================
 
-@app.get("/api/health")
+@system_router.get("/api/health")
 def health_check():
     return {"status": "ok", "time": datetime.now().isoformat()}
 
 
+@system_router.get("/api/startup")
+def startup_report():
+    """本 worker 的启动耗时分解（导入 / 建表 / 数据修复 / 预加载）"""
+    return boot.report()
+
+
+# ==================== 应用工厂 ====================
+
+def create_app() -> FastAPI:
+    """创建 FastAPI 应用（gunicorn 也可用 'main:create_app()' 启动）"""
+    application = FastAPI(
+        title="个人记账系统 API",
+        description="接收支付截图，AI 识别后入库，并提供统计查询接口",
+        version="1.0.0",
+        lifespan=lifespan,
+    )
+
+    # CORS 配置 — 允许前端跨域访问
+    application.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # 生产环境请改为具体域名
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # 大于 1KB 的响应启用 gzip（SSE 流不压缩）
+    application.add_middleware(GZipMiddleware, minimum_size=1024)
+
+    # 按需剖析（PROFILE_TOKEN / PROFILE_SLOW_MS 未配置时不注册）
+    if profiling.ENABLED:
+        application.add_middleware(profiling.ProfilingMiddleware)
+
+    application.include_router(router, prefix="/api")
+    application.include_router(router, prefix="/api/ledgers/{ledger_id}")
+    application.include_router(system_router)
+    return application
+
+
+app = create_app()
+boot.mark("create app")
+
+
 # ==================== 启动入口 ====================
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+"""
+商户维度
+
+账单上的商户名是识别/填写的原文，同一商户常有多种写法（"美团外卖" / "美团外卖-订单" / "美团外卖（订单详情）"）。
+入库时把原文规范化为 merchants 表里的一条记录，原文记为 merchant_aliases 中的别名，
+账单通过 merchant_id 引用；商户排行走 (merchant_id, date, ...) 索引分组，不再对字符串全表 GROUP BY。
+"""
+import re
+import unicodedata
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from database import insert
+from models import Receipt, Merchant, MerchantAlias
+
+# 括号内的附加说明：美团外卖（订单详情）/ 星巴克[APP]
+_BRACKETS = re.compile(r"[(\[（【<《][^)\]）】>》]*[)\]）】>》]")
+# 账单页附带的后缀：订单/账单类可直接相连（美团外卖订单），支付/交易类需有分隔符，避免把"微信支付"截成"微信"
+_SUFFIX = re.compile(
+    r"(?:[\s\-_—·|:：]*(?:订单详情|订单|账单详情|账单)"
+    r"|[\s\-_—·|:：]+(?:支付|付款|收款|交易|消费))$"
+)
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(raw: str) -> str:
+    """原文 → 规范名：全半角统一、去括号说明、去订单/支付类后缀、合并空白"""
+    cleaned = unicodedata.normalize("NFKC", raw or "").strip()
+    name = _BRACKETS.sub("", cleaned)
+    while True:
+        stripped = _SUFFIX.sub("", name).strip(" -_—·|:：")
+        if stripped == name:
+            break
+        name = stripped
+    name = _SPACES.sub(" ", name).strip()
+    return (name or cleaned)[:100]
+
+
+def resolve(db: Session, raw: str) -> int:
+    """
+    原文 → merchant_id（在当前事务中按需创建商户与别名，调用方 commit）
+
+    先查别名（合并过的写法直接命中），再查规范名是否已是别名（被合并掉的商户名会记为目标商户的别名，
+    规范化后等于它的新写法应归入目标商户，而不是重建已合并的商户），最后按规范名查找/创建。
+    用 INSERT ... ON CONFLICT DO NOTHING，并发写入同一新商户时不会抛唯一约束异常打断事务。
+    """
+    alias = (raw or "").strip()[:100]
+    merchant_id = db.query(MerchantAlias.merchant_id).filter(MerchantAlias.alias == alias).scalar()
+    if merchant_id is not None:
+        return merchant_id
+
+    name = normalize(alias)
+    merchant_id = db.query(MerchantAlias.merchant_id).filter(MerchantAlias.alias == name).scalar()
+    if merchant_id is None:
+        db.execute(insert(Merchant).values(name=name).on_conflict_do_nothing(index_elements=[Merchant.name]))
+        merchant_id = db.query(Merchant.id).filter(Merchant.name == name).scalar()
+    db.execute(
+        insert(MerchantAlias)
+        .values(alias=alias, merchant_id=merchant_id)
+        .on_conflict_do_nothing(index_elements=[MerchantAlias.alias])
+    )
+    return merchant_id
+
+
+def assign(db: Session, receipt: Receipt):
+    """按账单当前的商户原文设置 merchant_id（新增 / 修改商户名时调用）"""
+    receipt.merchant_id = resolve(db, receipt.merchant)
+
+
+def backfill(db: Session) -> int:
+    """为还没有 merchant_id 的账单补上商户（升级后首次启动 / 数据修复后），返回补齐条数"""
+    raws = [
+        m for (m,) in
+        db.query(Receipt.merchant).filter(Receipt.merchant_id.is_(None)).distinct()
+    ]
+    updated = 0
+    for raw in raws:
+        merchant_id = resolve(db, raw)
+        updated += (
+            db.query(Receipt)
+            .filter(Receipt.merchant_id.is_(None), Receipt.merchant == raw)
+            .update({"merchant_id": merchant_id}, synchronize_session=False)
+        )
+    if raws:
+        db.commit()
+    if updated > 1000:
+        # 大批回填后刷新统计信息，否则规划器会优先选 type 单列索引而不是商户覆盖索引
+        db.execute(text("ANALYZE receipts"))
+        db.commit()
+    return updated
+
+
+def merge(db: Session, source_id: int, target_id: int) -> int:
+    """
+    把 source 商户并入 target：账单与别名改指向 target，source 的规范名也记为 target 的别名
+
+    Returns:
+        int: 改指向的账单条数
+    """
+    source = db.get(Merchant, source_id)
+    target = db.get(Merchant, target_id)
+    if source is None or target is None:
+        raise ValueError("商户不存在")
+    if source_id == target_id:
+        raise ValueError("不能与自身合并")
+
+    moved = (
+        db.query(Receipt)
+        .filter(Receipt.merchant_id == source_id)
+        .update({"merchant_id": target_id}, synchronize_session=False)
+    )
+    db.query(MerchantAlias).filter(MerchantAlias.merchant_id == source_id).update(
+        {"merchant_id": target_id}, synchronize_session=False
+    )
+    db.execute(
+        insert(MerchantAlias)
+        .values(alias=source.name, merchant_id=target_id)
+        .on_conflict_do_update(index_elements=[MerchantAlias.alias], set_={"merchant_id": target_id})
+    )
+    db.delete(source)
+    db.commit()
+    return moved
+
+
+def top(db: Session, start: date, end: date, type: str, order: str, limit: int) -> dict:
+    """区间内按商户汇总的金额与笔数排行"""
+    total_amount, total_count = (
+        db.query(func.sum(Receipt.amount), func.count())
+        .filter(Receipt.date >= start.isoformat(), Receipt.date <= end.isoformat(), Receipt.type == type)
+        .one()
+    )
+    total_amount = total_amount or 0.0
+
+    amount = func.sum(Receipt.amount).label("amount")
+    count = func.count().label("count")
+    # 先在 (merchant_id, date, type, amount) 覆盖索引上分组，只有入榜的 limit 个商户再回查名称
+    grouped = (
+        db.query(Receipt.merchant_id, amount, count)
+        .filter(
+            Receipt.merchant_id.isnot(None),
+            Receipt.date >= start.isoformat(),
+            Receipt.date <= end.isoformat(),
+            Receipt.type == type,
+        )
+        .group_by(Receipt.merchant_id)
+        .order_by((amount if order == "amount" else count).desc(), Receipt.merchant_id)
+        .limit(limit)
+        .subquery()
+    )
+    rows = (
+        db.query(grouped.c.merchant_id, Merchant.name, grouped.c.amount, grouped.c.count)
+        .join(Merchant, Merchant.id == grouped.c.merchant_id)
+        .order_by((grouped.c.amount if order == "amount" else grouped.c.count).desc(), grouped.c.merchant_id)
+        .all()
+    )
+    return {
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "type": type,
+        "total_amount": round(total_amount, 2),
+        "total_count": total_count,
+        "items": [
+            {
+                "merchant_id": mid,
+                "merchant": name,
+                "amount": round(s or 0.0, 2),
+                "count": c,
+                "average": round((s or 0.0) / c, 2) if c else 0.0,
+                "percentage": round((s or 0.0) / total_amount * 100, 1) if total_amount > 0 else 0,
+            }
+            for mid, name, s, c in rows
+        ],
+    }
+
+
+def list_merchants(db: Session, keyword: Optional[str] = None) -> list[dict]:
+    """商户列表（含别名与账单笔数），按笔数倒序"""
+    counts = dict(
+        db.query(Receipt.merchant_id, func.count())
+        .filter(Receipt.merchant_id.isnot(None))
+        .group_by(Receipt.merchant_id)
+        .all()
+    )
+    aliases: dict[int, list[str]] = {}
+    for alias, mid in db.query(MerchantAlias.alias, MerchantAlias.merchant_id).order_by(MerchantAlias.alias):
+        aliases.setdefault(mid, []).append(alias)
+    query = db.query(Merchant.id, Merchant.name)
+    if keyword:
+        query = query.filter(Merchant.name.contains(keyword))
+    items = [
+        {"id": mid, "name": name, "aliases": aliases.get(mid, []), "count": counts.get(mid, 0)}
+        for mid, name in query
+    ]
+    return sorted(items, key=lambda x: (-x["count"], x["name"]))
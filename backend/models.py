@@ -1,24 +1,62 @@
 """
 SQLAlchemy 数据模型
 """
-from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Index
+from datetime import date, datetime
+from sqlalchemy import Column, Integer, String, Float, Numeric, Text, Date, DateTime, Index, ForeignKey
+from sqlalchemy.types import TypeDecorator
 from database import Base
 
 
+class DateString(TypeDecorator):
+    """
+    账单日期：代码里始终是 'YYYY-MM-DD' 字符串
+
+    SQLite 按文本存储（字典序即日期序）；Postgres 存为原生 DATE，
+    可直接 date_trunc / 区间比较，写入与读出时在字符串和 date 之间转换。
+    """
+    impl = String(10)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(Date())
+        return dialect.type_descriptor(String(10))
+
+    def process_bind_param(self, value, dialect):
+        if dialect.name == "postgresql" and isinstance(value, str):
+            return date.fromisoformat(value.strip())
+        return value
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+
+# 金额：Postgres 用定点 NUMERIC 避免浮点累加误差，读出仍为 float
+Money = Float().with_variant(Numeric(12, 2, asdecimal=False), "postgresql")
+
+
 class Receipt(Base):
     """账单记录表"""
     __tablename__ = "receipts"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    date = Column(String(10), nullable=False, index=True)          # 'YYYY-MM-DD'
-    merchant = Column(String(100), nullable=False)                  # 商家名称
-    amount = Column(Float, nullable=False)                          # 金额
+    date = Column(DateString, nullable=False, index=True)           # 'YYYY-MM-DD'
+    merchant = Column(String(100), nullable=False)                  # 商家名称（识别/填写的原文）
+    merchant_id = Column(Integer, ForeignKey("merchants.id"), nullable=True)  # 规范化商户
+    amount = Column(Money, nullable=False)                          # 金额
     type = Column(String(10), nullable=False, index=True)           # 'income' | 'expense'
     category = Column(String(20), nullable=False, index=True)       # 分类
     raw_response = Column(Text, nullable=True)                      # AI 原始返回
     image_hash = Column(String(32), nullable=True, unique=True)     # 图片 MD5
     created_at = Column(DateTime, default=datetime.now)             # 入库时间
+    edited_at = Column(DateTime, nullable=True)                     # 最近一次手动编辑时间（reparse 默认跳过）
+
+    __table_args__ = (
+        # 商户分析：按 merchant_id 分组、date 过滤，type / amount 一并放入索引，无需回表
+        Index("ix_receipts_merchant_date", "merchant_id", "date", "type", "amount"),
+    )
 
     def to_dict(self):
         return {
@@ -46,3 +84,58 @@ class Setting(Base):
             "value": self.value,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
+
+
+class LedgerChange(Base):
+    """账本变更日志（供 SSE 推送与各 worker 内存分析引擎同步）"""
+    __tablename__ = "ledger_changes"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    op = Column(String(10), nullable=False)                         # 'created' | 'updated' | 'deleted' | 'reparsed'
+    receipt_id = Column(Integer, nullable=False)
+    payload = Column(Text, nullable=False)                          # 变更后（删除时为删除前）的账单 JSON
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class UploadClaim(Base):
+    """截图识别占位：同一图片哈希同时只允许一个请求调用 AI（跨 worker）"""
+    __tablename__ = "upload_claims"
+
+    image_hash = Column(String(32), primary_key=True)
+    owner = Column(String(40), nullable=False)                      # 持有者标识（pid + 随机串）
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class Budget(Base):
+    """分类月度预算表（每个月通用）"""
+    __tablename__ = "budgets"
+
+    category = Column(String(20), primary_key=True)                 # 分类
+    amount = Column(Money, nullable=False)                          # 每月预算金额
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class BudgetSpend(Base):
+    """按 (月份, 分类) 累计的支出，随账单写入在同一事务中增量维护"""
+    __tablename__ = "budget_spend"
+
+    month = Column(String(7), primary_key=True)                     # 'YYYY-MM'
+    category = Column(String(20), primary_key=True)
+    spent = Column(Money, nullable=False, default=0.0)
+
+
+class Merchant(Base):
+    """商户维度表：规范化后的商户名"""
+    __tablename__ = "merchants"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(100), nullable=False, unique=True)         # 规范名，如 "美团外卖"
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class MerchantAlias(Base):
+    """商户别名：账单上出现过的原始写法 → 商户"""
+    __tablename__ = "merchant_aliases"
+
+    alias = Column(String(100), primary_key=True)                   # 原文，如 "美团外卖-订单"
+    merchant_id = Column(Integer, ForeignKey("merchants.id"), nullable=False, index=True)
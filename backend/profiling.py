@@ -0,0 +1,291 @@
+"""
+按需请求剖析
+
+两种触发方式（都需在 .env 中开启，未配置时不注册中间件与 SQL 事件监听，零开销）：
+- 手动：PROFILE_TOKEN 已设置，请求带 `X-Profile-Token: <token>` 头或 `?profile=<token>` 参数，
+  对该请求做 cProfile，并记录 SQL 与模型等待耗时
+- 自动：PROFILE_SLOW_MS 已设置，超过阈值的请求记录 SQL 与模型等待耗时
+  （不做 cProfile：事件循环上并发的请求无法逐个归属采样，常开 cProfile 代价也太高）
+
+结果保存在 data/profiles/：<名称>.json 为摘要，<名称>.prof 为 pstats 数据（可用 snakeviz 查看），
+最多保留 PROFILE_KEEP 份。列表见 /api/profiles。
+"""
+import asyncio
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from fastapi.routing import APIRoute
+
+from database import DATA_DIR
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 0))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 100))
+ENABLED = bool(PROFILE_TOKEN or PROFILE_SLOW_MS > 0)
+
+SKIP_PATHS = ("/api/events", "/api/profiles")   # SSE 长连接与剖析结果本身不剖析
+SKIP_SUFFIXES = ("/events",)                      # 其他账本的 SSE：/api/ledgers/<id>/events
+MAX_STATEMENTS = 200
+TOP_FUNCTIONS = 40
+
+
+class Trace:
+    """一次请求的剖析数据，经 contextvar 传到线程池中执行的同步接口"""
+
+    def __init__(self, cprofile: bool):
+        self.started = time.perf_counter()
+        self.cprofile = cprofile                         # 是否请求了 cProfile
+        self.profiler: Optional[cProfile.Profile] = None  # 实际运行的那一个（在接口包装里启停）
+        self.statements: list[tuple[str, float]] = []   # (SQL, 毫秒)
+        self.spans: dict[str, float] = {}               # 名称 → 累计毫秒
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("profile_trace", default=None)
+# 整个进程同一时间只能有一个 cProfile（3.12 起基于 sys.monitoring，第二个 enable() 直接抛 ValueError），
+# 拿不到时该请求只记录 SQL 与模型等待耗时
+_profiler_lock = threading.Lock()
+
+
+@contextmanager
+def span(name: str):
+    """记录一段耗时（如等待模型返回）；当前请求未被剖析时只多一次 contextvar 读取"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans[name] = trace.spans.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+# ==================== SQL 耗时 ====================
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current.get()
+    if trace is None:
+        return
+    started = conn.info.get("profile_started")
+    if started:
+        ms = (time.perf_counter() - started.pop()) * 1000
+        if len(trace.statements) < MAX_STATEMENTS:
+            trace.statements.append((" ".join(statement.split())[:500], round(ms, 2)))
+
+
+def _listen_engine_events():
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    event.listen(Engine, "before_cursor_execute", _before_execute)
+    event.listen(Engine, "after_cursor_execute", _after_execute)
+
+
+# ==================== 接口包装 ====================
+
+@contextmanager
+def _profiled(trace: Optional[Trace]):
+    """在接口实际执行的线程上启停本请求唯一的 cProfile"""
+    if trace is None or not trace.cprofile or not _profiler_lock.acquire(blocking=False):
+        yield
+        return
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 调试器 / coverage 等其他剖析工具占用中：只记录耗时
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            trace.profiler = profiler
+    finally:
+        _profiler_lock.release()
+
+
+def _profile_in_thread(func):
+    """同步接口：在线程池线程内剖析（事件循环线程不另开 cProfile）"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _profiled(_current.get()):
+            return func(*args, **kwargs)
+    wrapper.profiled = True
+    return wrapper
+
+
+def _profile_on_loop(func):
+    """异步接口：在事件循环线程上剖析（await 期间同一循环上其他任务的调用也会计入）"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with _profiled(_current.get()):
+            return await func(*args, **kwargs)
+    wrapper.profiled = True
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        # include_router 会用已包装的 endpoint 再建一次路由（同一 router 挂载多个前缀），不重复包装
+        if not getattr(endpoint, "profiled", False):
+            if asyncio.iscoroutinefunction(endpoint):
+                endpoint = _profile_on_loop(endpoint)
+            else:
+                endpoint = _profile_in_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def route_class() -> type[APIRoute]:
+    """APIRouter 的 route_class：未开启剖析时使用原生 APIRoute"""
+    return ProfiledRoute if ENABLED else APIRoute
+
+
+# ==================== 中间件 ====================
+
+def _requested(scope) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    for key, value in scope["headers"]:
+        if key == b"x-profile-token":
+            return value.decode("latin-1") == PROFILE_TOKEN
+    query = scope.get("query_string", b"").decode("latin-1")
+    return f"profile={PROFILE_TOKEN}" in query.split("&")
+
+
+class ProfilingMiddleware:
+    """纯 ASGI 中间件：与接口在同一个任务中运行，contextvar 能一路传到线程池"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"].startswith(SKIP_PATHS)
+            or scope["path"].endswith(SKIP_SUFFIXES)
+        ):
+            return await self.app(scope, receive, send)
+        manual = _requested(scope)
+        if not manual and PROFILE_SLOW_MS <= 0:
+            return await self.app(scope, receive, send)
+
+        trace = Trace(cprofile=manual)
+        token = _current.set(trace)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            total_ms = (time.perf_counter() - trace.started) * 1000
+            if manual or total_ms >= PROFILE_SLOW_MS:
+                await asyncio.to_thread(_save, scope, status["code"], trace, total_ms, manual)
+
+
+# ==================== 存储 ====================
+
+def _slug(path: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_")[:60] or "root"
+
+
+def _masked_query(scope) -> str:
+    query = scope.get("query_string", b"").decode("latin-1")
+    if PROFILE_TOKEN:
+        query = query.replace(f"profile={PROFILE_TOKEN}", "profile=***")
+    return query
+
+
+def _save(scope, status: int, trace: Trace, total_ms: float, manual: bool):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{_slug(scope['path'])}"
+    summary = {
+        "name": name,
+        "method": scope["method"],
+        "path": scope["path"],
+        "query": _masked_query(scope),
+        "status": status,
+        "trigger": "manual" if manual else "slow",
+        "total_ms": round(total_ms, 1),
+        "sql_count": len(trace.statements),
+        "sql_ms": round(sum(ms for _, ms in trace.statements), 1),
+        "spans": {k: round(v, 1) for k, v in trace.spans.items()},
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "statements": [{"sql": sql, "ms": ms} for sql, ms in trace.statements],
+        "functions": None,
+    }
+    if trace.profiler:
+        stats = pstats.Stats(trace.profiler)
+        stats.dump_stats(os.path.join(PROFILE_DIR, name + ".prof"))
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        summary["functions"] = out.getvalue()
+    with open(os.path.join(PROFILE_DIR, name + ".json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=1)
+    _prune()
+
+
+def _prune():
+    names = sorted(n[:-5] for n in os.listdir(PROFILE_DIR) if n.endswith(".json"))
+    for name in names[:-PROFILE_KEEP]:
+        for ext in (".json", ".prof"):
+            path = os.path.join(PROFILE_DIR, name + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def list_profiles() -> list[dict]:
+    """按时间倒序列出剖析摘要（不含 SQL 明细与函数表）"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    items = []
+    for name in sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".json")), reverse=True):
+        try:
+            with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        data.pop("statements", None)
+        data.pop("functions", None)
+        items.append(data)
+    return items
+
+
+def load_profile(name: str) -> Optional[dict]:
+    path = os.path.join(PROFILE_DIR, os.path.basename(name) + ".json")
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def authorized(token: Optional[str]) -> bool:
+    """查看剖析结果需提供 PROFILE_TOKEN（只开了慢请求阈值时不限制）"""
+    return not PROFILE_TOKEN or token == PROFILE_TOKEN
+
+
+if ENABLED:
+    _listen_engine_events()
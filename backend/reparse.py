@@ -0,0 +1,160 @@
+"""
+离线重新解析：用当前的 _parse_and_clean 重新清洗所有账单保存的 raw_response
+
+清洗规则（金额正则、商户名规范化、VALID_CATEGORIES 等）修改后，用它把修复应用到历史账单，
+不需要重新上传截图，也不调用 AI。
+
+用法:
+    python reparse.py --dry-run          # 只输出差异
+    python reparse.py                    # 应用修改
+    python reparse.py --include-edited   # 连手动编辑过的账单（edited_at 非空）也覆盖
+    python reparse.py --ledger family    # 多账本模式下处理指定账本
+
+手动编辑的账单由 receipts.edited_at 标记；升级时按变更日志中尚存的编辑记录补标，
+更早（变更日志上线前）的手动修改无法识别，首次运行前请先 --dry-run 核对差异。
+
+按 id 分块读取，进程池并行解析，每块一个事务批量更新；
+同时写入变更日志、调整预算累计，运行中的服务会自动追平。
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import ledgers
+from models import Receipt
+from ai_service import _parse_and_clean
+from events import record_change
+import budgets
+import merchants
+
+FIELDS = ("date", "merchant", "amount", "type", "category")
+
+
+def _parse(item: tuple[int, str]) -> tuple[int, Optional[dict], Optional[str]]:
+    """进程池任务：(id, raw_response) → (id, 清洗结果, 错误信息)"""
+    receipt_id, raw = item
+    try:
+        parsed = _parse_and_clean(raw)
+        return receipt_id, {f: parsed[f] for f in FIELDS}, None
+    except (ValueError, TypeError) as e:
+        return receipt_id, None, str(e)[:120]
+
+
+def _edited_ids(db) -> set[int]:
+    """手动编辑过的账单（edited_at 由编辑接口写入，不随变更日志清理而丢失）"""
+    rows = db.query(Receipt.id).filter(Receipt.edited_at.isnot(None))
+    return {rid for (rid,) in rows}
+
+
+def _diff(current: tuple, parsed: dict) -> dict:
+    """返回 {字段: (旧值, 新值)}"""
+    changes = {}
+    for field, old in zip(FIELDS, current):
+        new = parsed[field]
+        if field == "date" and new == date.today().isoformat() and old != new:
+            # 日期无法识别时解析器回退为「今天」，不能拿来覆盖历史日期
+            continue
+        if field == "amount" and old is not None and abs(old - new) < 0.005:
+            continue
+        if old != new:
+            changes[field] = (old, new)
+    return changes
+
+
+def _apply(db, diffs: dict[int, dict]) -> int:
+    """在一个事务里批量更新一块账单，返回实际更新条数"""
+    receipts = db.query(Receipt).filter(Receipt.id.in_(list(diffs))).all()
+    for receipt in receipts:
+        before = budgets.snapshot(receipt)
+        for field, (_, new) in diffs[receipt.id].items():
+            setattr(receipt, field, new)
+        if "merchant" in diffs[receipt.id]:
+            merchants.assign(db, receipt)
+        record_change(db, "reparsed", receipt)
+        budgets.apply_change(db, before, receipt)
+    db.commit()
+    return len(receipts)
+
+
+def run(dry_run: bool, chunk_size: int, workers: int, include_edited: bool, show: int, ledger_id: str):
+    db = ledgers.cache.get(ledger_id).session()   # 首次打开时完成建表 / 迁移
+    total = db.query(Receipt.id).filter(Receipt.raw_response.isnot(None)).count()
+    skip_ids = set() if include_edited else _edited_ids(db)
+
+    print("=" * 60)
+    print(f"重新解析 {total} 条账单{'（dry-run，不写入）' if dry_run else ''}")
+    if skip_ids:
+        print(f"跳过 {len(skip_ids)} 条手动编辑过的账单（--include-edited 可覆盖）")
+    print("=" * 60)
+
+    started = time.perf_counter()
+    processed = changed = updated = errors = shown = 0
+    field_counts = {f: 0 for f in FIELDS}
+    last_id = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # 按 id 键集分页，避免 OFFSET 越翻越慢
+            chunk = (
+                db.query(Receipt.id, Receipt.raw_response, *(getattr(Receipt, f) for f in FIELDS))
+                .filter(Receipt.id > last_id, Receipt.raw_response.isnot(None))
+                .order_by(Receipt.id)
+                .limit(chunk_size)
+                .all()
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            current = {row[0]: tuple(row[2:]) for row in chunk}
+
+            diffs: dict[int, dict] = {}
+            items = [(row[0], row[1]) for row in chunk]
+            for receipt_id, parsed, error in pool.map(_parse, items, chunksize=max(1, len(items) // (workers * 4))):
+                if error:
+                    errors += 1
+                    continue
+                if receipt_id in skip_ids:
+                    continue
+                d = _diff(current[receipt_id], parsed)
+                if d:
+                    diffs[receipt_id] = d
+                    for field in d:
+                        field_counts[field] += 1
+                    if shown < show:
+                        shown += 1
+                        detail = "，".join(f"{f}: {o} → {n}" for f, (o, n) in d.items())
+                        print(f"  #{receipt_id} {detail}")
+
+            processed += len(chunk)
+            changed += len(diffs)
+            if diffs and not dry_run:
+                updated += _apply(db, diffs)
+            print(f"[进度] {processed}/{total}  变化 {changed}  解析失败 {errors}")
+
+    db.close()
+    elapsed = time.perf_counter() - started
+    print("\n" + "=" * 60)
+    if shown < changed:
+        print(f"（另有 {changed - shown} 条差异未列出，--show 调整）")
+    print(f"共处理 {processed} 条，用时 {elapsed:.1f}s，AI 调用 0 次")
+    print("字段变化: " + "，".join(f"{f} {n}" for f, n in field_counts.items()))
+    print(f"{'将更新' if dry_run else '已更新'} {updated if not dry_run else changed} 条，解析失败 {errors} 条")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用当前清洗规则重新解析历史账单的 raw_response")
+    parser.add_argument("--dry-run", action="store_true", help="只输出差异，不写入数据库")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="每块条数（一块一个事务）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="解析进程数")
+    parser.add_argument("--include-edited", action="store_true", help="覆盖手动编辑过的账单")
+    parser.add_argument("--show", type=int, default=50, help="最多列出多少条差异明细")
+    parser.add_argument("--ledger", default=ledgers.DEFAULT, help="账本 id（多账本模式）")
+    args = parser.parse_args()
+    run(args.dry_run, args.chunk_size, args.workers, args.include_edited, args.show, args.ledger)
@@ -0,0 +1,31 @@
+"""
+高性能响应序列化
+
+列表与统计接口直接返回 FastResponse：
+- 只查需要的列（元组），不构造 ORM 对象、不走 to_dict()
+- 跳过 Pydantic 校验与 FastAPI 按 response_model 的二次校验（response_model 仅用于文档）
+- 用 orjson 编码（datetime 原生支持，输出与 isoformat() 一致）
+"""
+import orjson
+from fastapi.responses import JSONResponse
+
+from models import Receipt
+
+# 与 ReceiptData 字段一一对应
+RECEIPT_FIELDS = ("id", "date", "merchant", "amount", "type", "category", "created_at")
+RECEIPT_COLUMNS = (
+    Receipt.id, Receipt.date, Receipt.merchant, Receipt.amount,
+    Receipt.type, Receipt.category, Receipt.created_at,
+)
+
+
+class FastResponse(JSONResponse):
+    """orjson 编码的 JSON 响应"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def receipt_rows(rows) -> list[dict]:
+    """RECEIPT_COLUMNS 查询结果 → ReceiptData 结构的字典列表"""
+    return [dict(zip(RECEIPT_FIELDS, row)) for row in rows]
@@ -1,10 +1,19 @@
 """
 Pydantic 请求/响应模型
 """
-from pydantic import BaseModel, Field
+from datetime import datetime
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional
 
 
+def normalize_date(value: str) -> str:
+    """YYYY-MM-DD（允许不补零，如 2026-2-5），统一为补零格式；不合法时抛 ValueError"""
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValueError("日期格式应为 YYYY-MM-DD")
+
+
 # ========== 请求模型 ==========
 
 class UploadReceiptRequest(BaseModel):
@@ -20,6 +29,11 @@ class UpdateReceiptRequest(BaseModel):
     type: Optional[str] = None
     category: Optional[str] = None
 
+    @field_validator("date")
+    @classmethod
+    def _check_date(cls, value: Optional[str]) -> Optional[str]:
+        return normalize_date(value) if value is not None else None
+
 
 class ManualReceiptRequest(BaseModel):
     """手动添加账单请求"""
@@ -29,6 +43,11 @@ class ManualReceiptRequest(BaseModel):
     type: str = Field(default="expense", description="income 或 expense")
     category: str = Field(default="其他", description="分类")
 
+    @field_validator("date")
+    @classmethod
+    def _check_date(cls, value: str) -> str:
+        return normalize_date(value)
+
 
 # ========== 响应模型 ==========
 
@@ -105,3 +124,194 @@ class NetWorthResponse(BaseModel):
 class UpdateNetWorthRequest(BaseModel):
     """更新净资产请求"""
     current_net_worth: float = Field(..., description="当前实际拥有的总资产")
+
+
+# ========== 区间分析 ==========
+
+class RangeStatsResponse(BaseModel):
+    """任意区间统计响应"""
+    start_date: str
+    end_date: str
+    total_expense: float
+    total_income: float
+    balance: float
+    by_category: list[CategoryStat]
+
+
+class RollingResponse(BaseModel):
+    """滚动 N 天合计响应"""
+    window: int
+    type: str
+    series: list[DailyStat]
+
+
+class CategoryCompare(BaseModel):
+    """分类同比/环比"""
+    category: str
+    current: float
+    previous: float
+    change: float
+    change_pct: Optional[float] = None
+
+
+class CompareResponse(BaseModel):
+    """同比/环比响应"""
+    mode: str
+    type: str
+    start_date: str
+    end_date: str
+    previous_start_date: str
+    previous_end_date: str
+    current_total: float
+    previous_total: float
+    change_pct: Optional[float] = None
+    by_category: list[CategoryCompare]
+
+
+class ProfileBucket(BaseModel):
+    """画像分桶（星期几 0-6 / 小时 0-23）"""
+    key: int
+    amount: float
+    count: int
+
+
+class ProfileResponse(BaseModel):
+    """星期/小时消费画像响应"""
+    type: str
+    weekday: list[ProfileBucket]
+    hour: list[ProfileBucket]
+
+
+# ========== 首页聚合 ==========
+
+class DashboardResponse(BaseModel):
+    """首页聚合响应：一次请求返回月度统计、净资产、最近账单与年度汇总"""
+    month_stats: MonthStatsResponse
+    net_worth: NetWorthResponse
+    recent: list[ReceiptData]
+    yearly: YearlyResponse
+
+
+# ========== 预算 ==========
+
+class BudgetItem(BaseModel):
+    """单个分类的预算使用情况"""
+    category: str
+    budget: float
+    spent: float
+    remaining: float
+    percentage: float
+
+
+class BudgetListResponse(BaseModel):
+    """月度预算响应"""
+    month: str
+    items: list[BudgetItem]
+
+
+class UpdateBudgetRequest(BaseModel):
+    """设置分类月度预算请求"""
+    amount: float = Field(..., gt=0, description="每月预算金额")
+
+
+# ========== 备份 ==========
+
+class BackupItem(BaseModel):
+    """单份快照"""
+    name: str
+    size: int
+    created_at: str
+
+
+class BackupListResponse(BaseModel):
+    """快照列表响应"""
+    items: list[BackupItem]
+
+
+class BackupResult(BaseModel):
+    """创建快照响应"""
+    name: str
+    size: int
+    seconds: float
+    removed: list[str]
+
+
+# ========== 商户 ==========
+
+class TopMerchantItem(BaseModel):
+    """商户排行中的一项"""
+    merchant_id: int
+    merchant: str
+    amount: float
+    count: int
+    average: float
+    percentage: float
+
+
+class TopMerchantsResponse(BaseModel):
+    """商户排行响应"""
+    start_date: str
+    end_date: str
+    type: str
+    total_amount: float
+    total_count: int
+    items: list[TopMerchantItem]
+
+
+class MerchantItem(BaseModel):
+    """商户及其别名"""
+    id: int
+    name: str
+    aliases: list[str]
+    count: int
+
+
+class MerchantListResponse(BaseModel):
+    """商户列表响应"""
+    items: list[MerchantItem]
+
+
+class MergeMerchantRequest(BaseModel):
+    """合并商户请求"""
+    source_id: int = Field(..., description="被合并的商户")
+    target_id: int = Field(..., description="保留的商户")
+
+
+# ========== 请求剖析 ==========
+
+class RequestProfileItem(BaseModel):
+    """一次请求剖析的摘要"""
+    name: str
+    method: str
+    path: str
+    query: str
+    status: int
+    trigger: str                 # manual 手动 / slow 慢请求
+    total_ms: float
+    sql_count: int
+    sql_ms: float
+    spans: dict[str, float]      # 如 {"model": 等待模型毫秒}
+    created_at: str
+
+
+class RequestProfileListResponse(BaseModel):
+    """剖析列表响应"""
+    items: list[RequestProfileItem]
+
+
+# ========== 账本 ==========
+
+class LedgerItem(BaseModel):
+    """账本"""
+    id: str
+    open: bool
+
+
+class LedgerListResponse(BaseModel):
+    """账本列表响应"""
+    items: list[LedgerItem]
+
+
+class CreateLedgerRequest(BaseModel):
+    """新建账本请求"""
+    id: str = Field(..., description="账本 id：小写字母、数字、- 和 _，最长 32 位")
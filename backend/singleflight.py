@@ -0,0 +1,134 @@
+"""
+上传单飞（single-flight）：同一截图并发上传时只调用一次 AI
+
+- 同一 worker 内：后到的请求直接等待先到请求的 asyncio.Event
+- 跨 worker：在 upload_claims 表插入以 image_hash 为主键的占位行，插入成功者负责识别；
+  其余请求轮询，直到账单入库（返回已有记录）或占位被释放（识别失败，重新争抢）
+- 占位行超过 CLAIM_TTL 视为持有者已崩溃，可被接管
+
+数据库读写都放到线程池执行（同 events.py）：占位提交可能等待其他 worker 持有的 SQLite 写锁，
+不能卡住事件循环上的其他请求与 SSE 推送。
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Receipt, UploadClaim
+
+CLAIM_TTL = timedelta(seconds=120)   # 大于 AI 调用超时（60s）
+POLL_INTERVAL = 0.5                  # 跨 worker 等待时的轮询间隔（秒）
+WAIT_TIMEOUT = 90.0                  # 最长等待时间（秒）
+
+_TOKEN = uuid.uuid4().hex[:8]
+_inflight: dict[tuple, asyncio.Event] = {}   # (会话工厂, image_hash) → 识别完成事件
+
+
+class UploadInProgress(Exception):
+    """等待其他请求识别同一截图超时"""
+
+
+def _owner() -> str:
+    """持有者标识：按调用时的 pid 计算，preload 后 fork 出的各 worker 互不相同"""
+    return f"{os.getpid()}-{_TOKEN}"
+
+
+def _try_claim(session_factory, image_hash: str) -> bool:
+    """插入占位行；已存在但过期则接管"""
+    db = session_factory()
+    try:
+        db.add(UploadClaim(image_hash=image_hash, owner=_owner()))
+        try:
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+        stale = (
+            db.query(UploadClaim)
+            .filter(
+                UploadClaim.image_hash == image_hash,
+                UploadClaim.created_at < datetime.now() - CLAIM_TTL,
+            )
+            .update({"owner": _owner(), "created_at": datetime.now()})
+        )
+        db.commit()
+        return stale == 1
+    finally:
+        db.close()
+
+
+def _receipt_exists(session_factory, image_hash: str) -> bool:
+    db = session_factory()
+    try:
+        return db.query(Receipt.id).filter(Receipt.image_hash == image_hash).first() is not None
+    finally:
+        db.close()
+
+
+async def acquire(image_hash: str, session_factory=SessionLocal) -> bool:
+    """
+    争抢识别权。session_factory 为截图所属账本的会话工厂（多账本模式下各账本互不影响）
+
+    Returns:
+        True: 本请求负责调用 AI，完成后必须调用 release()
+        False: 其他请求已把这张截图入库，直接查询返回即可
+
+    Raises:
+        UploadInProgress: 等待超时
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + WAIT_TIMEOUT
+    while True:
+        local = _inflight.get((session_factory, image_hash))
+        if local is not None:
+            # 同进程已有请求在识别，等它结束后再判断
+            remaining = deadline - loop.time()
+            try:
+                await asyncio.wait_for(local.wait(), timeout=max(remaining, 0))
+            except asyncio.TimeoutError:
+                raise UploadInProgress(image_hash)
+            if await asyncio.to_thread(_receipt_exists, session_factory, image_hash):
+                return False
+            continue
+
+        if await asyncio.to_thread(_receipt_exists, session_factory, image_hash):
+            return False
+        if await asyncio.to_thread(_try_claim, session_factory, image_hash):
+            _inflight[(session_factory, image_hash)] = asyncio.Event()
+            return True
+
+        if loop.time() >= deadline:
+            raise UploadInProgress(image_hash)
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def release_in(db: Session, image_hash: str):
+    """在账单入库的同一事务中删除占位行（调用方 commit）"""
+    db.query(UploadClaim).filter(
+        UploadClaim.image_hash == image_hash, UploadClaim.owner == _owner(),
+    ).delete()
+
+
+def _delete_claim(session_factory, image_hash: str):
+    db = session_factory()
+    try:
+        release_in(db, image_hash)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def release(image_hash: str, failed: bool = False, session_factory=SessionLocal):
+    """结束识别：唤醒同进程等待者；失败时删除占位行让其他请求重新争抢"""
+    try:
+        if failed:
+            await asyncio.to_thread(_delete_claim, session_factory, image_hash)
+    finally:
+        # 删除占位失败也要唤醒等待者（占位过期后可被接管）
+        event = _inflight.pop((session_factory, image_hash), None)
+        if event is not None:
+            event.set()
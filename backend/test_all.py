@@ -20,13 +20,12 @@ def insert_test_data():
     import os, sys
     sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
     
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
-    
-    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bookkeeping.db")
-    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
-    Session = sessionmaker(bind=engine)
-    db = Session()
+    from dotenv import load_dotenv
+    load_dotenv()
+    # 与服务使用同一个 DATABASE_URL（SQLite 或 PostgreSQL）
+    from database import SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
     
     from models import Receipt
     
@@ -95,6 +95,12 @@ systemctl daemon-reload
 systemctl enable bookkeeping
 systemctl restart bookkeeping
 
+# 每日在线备份（data/backups，保留份数见 .env 的 BACKUP_KEEP）
+cp $APP_DIR/deploy/bookkeeping-backup.service /etc/systemd/system/
+cp $APP_DIR/deploy/bookkeeping-backup.timer /etc/systemd/system/
+systemctl daemon-reload
+systemctl enable --now bookkeeping-backup.timer
+
 echo ""
 echo "===== ✅ 部署完成！ ====="
 echo "访问地址: http://你的服务器公网IP"
@@ -104,3 +110,5 @@ echo "  查看状态: systemctl status bookkeeping"
 echo "  查看日志: journalctl -u bookkeeping -f"
 echo "  重启服务: systemctl restart bookkeeping"
 echo "  更新部署: cd $APP_DIR && sudo bash deploy/update.sh"
+echo "  立即备份: cd $APP_DIR/backend && venv/bin/python backup.py create --all"
+echo "  恢复备份: cd $APP_DIR/backend && venv/bin/python backup.py restore <快照文件名>"
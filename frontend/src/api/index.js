@@ -8,6 +8,47 @@ const api = axios.create({
     timeout: 60000,
 })
 
+const LEDGER_KEY = 'ledger'
+
+/** 已打开的 SSE 订阅：切换账本时关闭并连到新账本 */
+const subscriptions = new Set()
+
+/** 当前账本 id（'default' 为默认账本） */
+export function getLedger() {
+    return localStorage.getItem(LEDGER_KEY) || 'default'
+}
+
+function ledgerBase(id) {
+    return !id || id === 'default' ? '/api' : `/api/ledgers/${encodeURIComponent(id)}`
+}
+
+/**
+ * 切换当前账本：之后的请求发往该账本，已打开的 SSE 订阅改连该账本；选择保存在本地，刷新后保持
+ * @param {string} id 账本 id，'default' 为默认账本
+ */
+export function setLedger(id) {
+    localStorage.setItem(LEDGER_KEY, id || 'default')
+    api.defaults.baseURL = ledgerBase(id)
+    for (const sub of subscriptions) sub.open()
+}
+
+api.defaults.baseURL = ledgerBase(getLedger())
+
+/** 账本列表 */
+export function listLedgers() {
+    return api.get('/ledgers', { baseURL: '/api' })
+}
+
+/** 新建账本 */
+export function createLedger(id) {
+    return api.post('/ledgers', { id }, { baseURL: '/api' })
+}
+
+/** 首页聚合：月度统计 + 净资产 + 最近账单 + 年度汇总（一次请求） */
+export function getDashboard(year, month, recent = 10) {
+    return api.get('/dashboard', { params: { year, month, recent } })
+}
+
 /** 获取月度统计 */
 export function getMonthStats(year, month) {
     return api.get('/get_stats', { params: { year, month } })
@@ -53,4 +94,76 @@ export function updateNetWorth(currentNetWorth) {
     return api.put('/net_worth', { current_net_worth: currentNetWorth })
 }
 
+/** 获取分类预算使用情况 */
+export function getBudgets(year, month) {
+    return api.get('/budgets', { params: { year, month } })
+}
+
+/** 设置分类月度预算 */
+export function setBudget(category, amount) {
+    return api.put(`/budgets/${encodeURIComponent(category)}`, { amount })
+}
+
+/** 取消分类预算 */
+export function deleteBudget(category) {
+    return api.delete(`/budgets/${encodeURIComponent(category)}`)
+}
+
+/** 任意区间统计 */
+export function getRangeStats(params) {
+    return api.get('/analytics/range', { params })
+}
+
+/** 滚动 N 天合计 */
+export function getRollingStats(params) {
+    return api.get('/analytics/rolling', { params })
+}
+
+/** 分类同比 / 环比 */
+export function getCompareStats(params) {
+    return api.get('/analytics/compare', { params })
+}
+
+/** 星期 / 小时消费画像 */
+export function getSpendingProfile(params) {
+    return api.get('/analytics/profile', { params })
+}
+
+/** 商户排行（金额 / 笔数） */
+export function getTopMerchants(params) {
+    return api.get('/merchants/top', { params })
+}
+
+/** 商户列表及别名 */
+export function getMerchants(keyword) {
+    return api.get('/merchants', { params: { keyword } })
+}
+
+/** 合并商户：source 并入 target */
+export function mergeMerchants(sourceId, targetId) {
+    return api.post('/merchants/merge', { source_id: sourceId, target_id: targetId })
+}
+
+/**
+ * 订阅账本变更 (SSE)
+ * @param {(event: {op: string, receipt: object, totals: object}) => void} onChange
+ * @returns {() => void} 取消订阅
+ */
+export function subscribeLedgerEvents(onChange) {
+    const sub = {
+        source: null,
+        open() {
+            if (this.source) this.source.close()
+            this.source = new EventSource(`${api.defaults.baseURL}/events`)
+            this.source.addEventListener('receipt', (e) => onChange(JSON.parse(e.data)))
+        },
+    }
+    sub.open()
+    subscriptions.add(sub)
+    return () => {
+        subscriptions.delete(sub)
+        sub.source.close()
+    }
+}
+
 export default api